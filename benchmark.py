@@ -0,0 +1,259 @@
+"""Scripted rendering benchmarks, run headless through DisplayMain.run_frame
+
+    python benchmark.py [--sizes demo,256,1024,4096] [--scenarios paint,pan,hover,resize] [--frames 200]
+                        [--chunk-size N] [--output results.json] [--baseline old.json] [--threshold 0.1]
+                        [--no-tracemalloc]
+
+Every scenario is run on every map size, the demo map or terrain generated with a fixed seed, and the results
+written as JSON. With --baseline the results are compared with an earlier run, and the exit status is 1 if any
+frame time percentile got slower by more than the threshold. Peak RSS is that of the whole process so far.
+counts are the frame profiler's counters added up over the scenario, sprites and surfaces made by the drawing
+code rather than every allocation. python_alloc comes from tracemalloc: the peak memory traced and the number
+of blocks allocated during the scenario still held at its end, from a second run with tracing on so that it
+doesn't slow down the timed one."""
+import argparse
+import json
+import math
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy
+import pygame
+
+import demo_map
+import profiler
+import pytile
+import terrain_gen
+import world
+
+SIZES = ["demo", "256", "1024", "4096"]
+SCENARIOS = ["paint", "pan", "hover", "resize"]
+FRAMES = 200
+WIDTH = 1024
+HEIGHT = 768
+SEED = 1
+PERCENTILES = (50, 95, 99)
+THRESHOLD = 0.1
+# Counts added up over a scenario rather than given as percentiles
+COUNTERS = profiler.FrameProfiler.COUNTERS
+
+
+def load_world(size, seed=SEED):
+    """Set the World up with the demo map, or generated terrain of size by size tiles
+    Returns the time taken in ms"""
+    start = time.perf_counter()
+    if size == "demo":
+        world.World.load_tile_map(demo_map.tile_map)
+    else:
+        world.World.set_store(terrain_gen.generate(int(size), int(size), seed))
+    return (time.perf_counter() - start) * 1000.0
+
+
+def centre_view(display):
+    """Put the view over the middle of the World"""
+    w = display.world
+    w.set_offset(w.WorldWidth2 - display.screen_width // 2, w.WorldHeight // 2 - display.screen_height // 2)
+
+
+def paint_frames(display, frames):
+    """Paint the whole view from scratch every frame, returns the frame records"""
+    records = []
+    for _ in range(frames):
+        display.profiler.begin_frame()
+        with display.profiler.timed("paint_world"):
+            display.paint_world(display.highlight, rebuild=True)
+        display.draw_frame()
+        records.append(display.profiler.end_frame())
+    return records
+
+
+def pan_frames(display, frames):
+    """Drag the view with the Move tool, changing direction every 60 frames"""
+    x, y = display.screen_width // 2, display.screen_height // 2
+    records = [display.run_frame([pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(x, y), button=3)])]
+    for i in range(1, frames):
+        direction = 1 if (i // 60) % 2 == 0 else -1
+        x -= 16 * direction
+        y -= 8 * direction
+        records.append(display.run_frame([pygame.event.Event(
+            pygame.MOUSEMOTION, pos=(x, y), rel=(-16 * direction, -8 * direction), buttons=(0, 0, 1))]))
+    return records
+
+
+def hover_frames(display, frames):
+    """Sweep the cursor around the screen, moving the Terrain tool's highlight"""
+    records = []
+    last = (0, 0)
+    for i in range(frames):
+        pos = (int(display.screen_width * (0.5 + 0.45 * math.sin(i * 0.05))),
+               int(display.screen_height * (0.5 + 0.45 * math.sin(i * 0.07))))
+        records.append(display.run_frame([pygame.event.Event(
+            pygame.MOUSEMOTION, pos=pos, rel=(pos[0] - last[0], pos[1] - last[1]), buttons=(0, 0, 0))]))
+        last = pos
+    return records
+
+
+def resize_frames(display, frames):
+    """Resize the window every frame, between its size and three quarters of it"""
+    width, height = display.screen_width, display.screen_height
+    records = []
+    for i in range(frames):
+        size = (width, height) if i % 2 else (width * 3 // 4, height * 3 // 4)
+        records.append(display.run_frame([pygame.event.Event(pygame.VIDEORESIZE, w=size[0], h=size[1], size=size)]))
+    return records
+
+
+# Each runs a number of frames on a DisplayMain and returns the profiler's records of them
+SCENARIO_FRAMES = {"paint": paint_frames, "pan": pan_frames, "hover": hover_frames, "resize": resize_frames}
+
+
+def percentiles(values):
+    """Return the PERCENTILES, mean and max of a list of values as a dict"""
+    values = numpy.array(values)
+    result = {"p%i" % pc: float(v) for pc, v in zip(PERCENTILES, numpy.percentile(values, PERCENTILES))}
+    result["mean"] = float(values.mean())
+    result["max"] = float(values.max())
+    return result
+
+
+def peak_rss_kb():
+    """Return the peak resident set size of the process so far, in KB"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives KB, macOS bytes
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def start_scenario(frames, width, height, chunk_size):
+    """Return a DisplayMain with the view centred and drawn, ready to run a scenario on"""
+    display = pytile.DisplayMain(width, height, world.World(), chunk_size, headless=True)
+    # Keep every frame for the percentiles
+    display.profiler = profiler.FrameProfiler(window=frames)
+    profiler.FrameProfiler.active = display.profiler
+    centre_view(display)
+    display.paint_world()
+    display.draw_frame()
+    return display
+
+
+def trace_scenario(scenario, frames, width, height, chunk_size):
+    """Run a scenario with tracemalloc on, returns the peak KB traced and the blocks still allocated after it"""
+    display = start_scenario(frames, width, height, chunk_size)
+    tracemalloc.start()
+    try:
+        SCENARIO_FRAMES[scenario](display, frames)
+        peak = tracemalloc.get_traced_memory()[1]
+        blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    finally:
+        tracemalloc.stop()
+    return {"peak_kb": peak // 1024, "blocks": blocks}
+
+
+def run_scenario(size, scenario, frames=FRAMES, width=WIDTH, height=HEIGHT, chunk_size=None, trace=True):
+    """Run one scenario on the World as loaded by load_world(size), returns its results
+    None of the scenarios edit the terrain, so they can all be run on one load of it"""
+    display = start_scenario(frames, width, height, chunk_size)
+    records = SCENARIO_FRAMES[scenario](display, frames)
+    result = {
+        "size": size,
+        "scenario": scenario,
+        "tiles": world.World.WorldX * world.World.WorldY,
+        "frames": len(records),
+        "frame_ms": percentiles([r["frame_ms"] for r in records]),
+        "phase_ms": {phase: percentiles([r[phase] for r in records]) for phase in profiler.FrameProfiler.PHASES},
+        "counts": {counter: int(sum(r[counter] for r in records)) for counter in COUNTERS},
+        "peak_rss_kb": peak_rss_kb(),
+    }
+    if trace:
+        result["python_alloc"] = trace_scenario(scenario, frames, width, height, chunk_size)
+    return result
+
+
+def run(sizes=SIZES, scenarios=SCENARIOS, frames=FRAMES, width=WIDTH, height=HEIGHT, chunk_size=None, log=None,
+        trace=True):
+    """Run every scenario on every map size, returns the results of all of them"""
+    results = []
+    for size in sizes:
+        load_ms = load_world(size)
+        for scenario in scenarios:
+            result = run_scenario(size, scenario, frames, width, height, chunk_size, trace)
+            result["load_ms"] = load_ms
+            results.append(result)
+            if log:
+                log.write("%-6s %-7s p50 %7.2f ms  p95 %7.2f ms  p99 %7.2f ms  rss %i KB\n" % (
+                    size, scenario, result["frame_ms"]["p50"], result["frame_ms"]["p95"],
+                    result["frame_ms"]["p99"], result["peak_rss_kb"]))
+    return {
+        "width": width,
+        "height": height,
+        "frames": frames,
+        "chunk_size": chunk_size,
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "numpy": numpy.__version__,
+        "results": results,
+    }
+
+
+def compare(report, baseline, threshold=THRESHOLD):
+    """Compare the frame times of a report with those of a baseline report
+    Returns a list of (size, scenario, percentile, baseline ms, ms, ratio, regressed) for the runs in both"""
+    old = {(r["size"], r["scenario"]): r for r in baseline["results"]}
+    rows = []
+    for result in report["results"]:
+        before = old.get((result["size"], result["scenario"]))
+        if before is None:
+            continue
+        for pc in ["p%i" % pc for pc in PERCENTILES]:
+            old_ms = before["frame_ms"][pc]
+            new_ms = result["frame_ms"][pc]
+            ratio = new_ms / old_ms if old_ms > 0 else math.inf
+            rows.append((result["size"], result["scenario"], pc, old_ms, new_ms, ratio, ratio > 1.0 + threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the scripted rendering benchmarks headless")
+    parser.add_argument("--sizes", default=",".join(SIZES), help="map sizes, demo or tiles along a side")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="any of " + ", ".join(SCENARIOS))
+    parser.add_argument("--frames", type=int, default=FRAMES, help="frames per scenario")
+    parser.add_argument("--width", type=int, default=WIDTH)
+    parser.add_argument("--height", type=int, default=HEIGHT)
+    parser.add_argument("--chunk-size", type=int, default=None, help="draw prerendered chunks of tiles")
+    parser.add_argument("--output", help="write the results to this JSON file rather than stdout")
+    parser.add_argument("--baseline", help="compare with the results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="slowdown relative to the baseline counted as a regression")
+    parser.add_argument("--no-tracemalloc", dest="trace", action="store_false",
+                        help="don't run each scenario again to trace Python allocations")
+    args = parser.parse_args(argv)
+
+    scenarios = args.scenarios.split(",")
+    for scenario in scenarios:
+        if scenario not in SCENARIO_FRAMES:
+            parser.error("unknown scenario %s" % scenario)
+
+    report = run(args.sizes.split(","), scenarios, args.frames, args.width, args.height, args.chunk_size,
+                 log=sys.stderr, trace=args.trace)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            rows = compare(report, json.load(f), args.threshold)
+        for size, scenario, pc, old_ms, new_ms, ratio, regressed in rows:
+            sys.stderr.write("%-6s %-7s %-4s %8.2f -> %8.2f ms  x%.2f%s\n" % (
+                size, scenario, pc, old_ms, new_ms, ratio, "  REGRESSION" if regressed else ""))
+        if any(row[-1] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
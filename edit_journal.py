@@ -0,0 +1,159 @@
+import collections
+
+import numpy
+
+
+class JournalEntry(object):
+    """One undoable edit, the old and new state of every tile it changed as packed arrays"""
+
+    def __init__(self, index, old_heights, old_packed, new_heights, new_packed):
+        # Tile index is x * size_y + y
+        self.index = index
+        self.old_heights = old_heights
+        self.old_packed = old_packed
+        self.new_heights = new_heights
+        self.new_packed = new_packed
+
+    def nbytes(self):
+        """Return the memory used by this entry"""
+        return (self.index.nbytes + self.old_heights.nbytes + self.old_packed.nbytes +
+                self.new_heights.nbytes + self.new_packed.nbytes)
+
+
+class EditJournal(object):
+    """Undo/redo history of terrain edits
+    Between begin() and commit() the old state of every tile about to be written is recorded, once per tile,
+    commit() then keeps only the tiles which actually changed. Edits can be nested, only the outermost commit
+    makes an entry. The oldest entries are dropped once the history, counting the edit being recorded, uses more
+    than memory_cap bytes; an edit too big to fit at all can't be undone, and clears the history."""
+
+    DEFAULT_MEMORY_CAP = 64 << 20
+    # Size of a tile in an entry: index, old and new heights and packed vertices
+    TILE_NBYTES = 4 + 2 * (2 + 1)
+
+    def __init__(self, size_y, memory_cap=DEFAULT_MEMORY_CAP):
+        self.size_y = size_y
+        self.memory_cap = memory_cap
+        self.undo_entries = collections.deque()
+        self.redo_entries = []
+        self.nbytes = 0
+        self.depth = 0
+        # Tile index -> (height, packed) from before the current edit
+        self.recorded = {}
+        # Set if the current edit outgrew memory_cap and isn't being recorded any more
+        self.overflowed = False
+
+    def recording(self):
+        """Return True if an edit is in progress"""
+        return self.depth > 0
+
+    def pending_nbytes(self):
+        """Return the memory the current edit will take as an entry"""
+        return len(self.recorded) * self.TILE_NBYTES
+
+    def begin(self):
+        """Start recording an edit"""
+        self.depth += 1
+
+    def record(self, store, xs, ys):
+        """Record the current state of some tiles before they're written to, if they haven't been already"""
+        if self.overflowed:
+            return
+        index = numpy.asarray(xs, dtype=numpy.int64) * self.size_y + numpy.asarray(ys, dtype=numpy.int64)
+        index = numpy.unique(index)
+        index = index[numpy.array([i not in self.recorded for i in index.tolist()], dtype=bool)]
+        if not len(index):
+            return
+        heights, packed = store.gather(index // self.size_y, index % self.size_y)
+        self.recorded.update(zip(index.tolist(), zip(numpy.asarray(heights).tolist(), numpy.asarray(packed).tolist())))
+        self.fit_recorded()
+
+    def record_tile(self, store, x, y):
+        """Record the current state of one tile before it's written to, if it hasn't been already"""
+        index = x * self.size_y + y
+        if self.overflowed or index in self.recorded:
+            return
+        self.recorded[index] = store.get(x, y)
+        self.fit_recorded()
+
+    def fit_recorded(self):
+        """Make room for the edit being recorded, giving up on it if it can't fit"""
+        self.evict()
+        if self.nbytes + self.pending_nbytes() > self.memory_cap:
+            self.recorded = {}
+            self.overflowed = True
+
+    def commit(self, store):
+        """Finish recording an edit, returns the new entry or None if nothing changed"""
+        if self.depth == 0:
+            return None
+        self.depth -= 1
+        if self.depth > 0:
+            return None
+        if self.overflowed:
+            # The edit can't be undone, and the history from before it no longer leads anywhere sensible
+            self.overflowed = False
+            self.clear()
+            return None
+        if not self.recorded:
+            return None
+        index = numpy.fromiter(self.recorded.keys(), dtype=numpy.int64, count=len(self.recorded))
+        old = numpy.array(list(self.recorded.values()), dtype=numpy.int64).reshape(-1, 2)
+        self.recorded = {}
+        order = numpy.argsort(index)
+        index = index[order]
+        old_heights = old[order, 0].astype(numpy.int16)
+        old_packed = old[order, 1].astype(numpy.uint8)
+        new_heights, new_packed = store.gather(index // self.size_y, index % self.size_y)
+        changed = (old_heights != new_heights) | (old_packed != new_packed)
+        if not changed.any():
+            return None
+        entry = JournalEntry(index[changed].astype(numpy.uint32), old_heights[changed], old_packed[changed],
+                             numpy.array(new_heights[changed], dtype=numpy.int16),
+                             numpy.array(new_packed[changed], dtype=numpy.uint8))
+        self.clear_redo()
+        self.undo_entries.append(entry)
+        self.nbytes += entry.nbytes()
+        self.evict()
+        return entry
+
+    def clear(self):
+        """Forget all the history"""
+        self.undo_entries.clear()
+        self.redo_entries = []
+        self.nbytes = 0
+
+    def clear_redo(self):
+        """Forget all undone edits"""
+        for entry in self.redo_entries:
+            self.nbytes -= entry.nbytes()
+        self.redo_entries = []
+
+    def evict(self):
+        """Drop the oldest history until it fits within memory_cap along with the edit being recorded"""
+        while self.nbytes + self.pending_nbytes() > self.memory_cap and self.redo_entries:
+            self.nbytes -= self.redo_entries.pop(0).nbytes()
+        while self.nbytes + self.pending_nbytes() > self.memory_cap and self.undo_entries:
+            self.nbytes -= self.undo_entries.popleft().nbytes()
+
+    def tiles(self, entry, heights, packed):
+        """Return one side of an entry as (xs, ys, heights, packed) arrays to be written"""
+        xs = entry.index.astype(numpy.int64) // self.size_y
+        ys = entry.index.astype(numpy.int64) % self.size_y
+        return xs, ys, heights, packed
+
+    def undo(self):
+        """Step back over the last edit, returns the (xs, ys, heights, packed) to write, or None"""
+        if self.depth > 0 or not self.undo_entries:
+            return None
+        entry = self.undo_entries.pop()
+        self.redo_entries.append(entry)
+        return self.tiles(entry, entry.old_heights, entry.old_packed)
+
+    def redo(self):
+        """Step forward over the last undone edit, returns the (xs, ys, heights, packed) to write, or None"""
+        if self.depth > 0 or not self.redo_entries:
+            return None
+        entry = self.redo_entries.pop()
+        self.undo_entries.append(entry)
+        return self.tiles(entry, entry.new_heights, entry.new_packed)
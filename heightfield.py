@@ -0,0 +1,352 @@
+import numpy
+
+# Vertex heights are stored packed into a single byte, two bits per vertex
+# Bit layout: left | bottom << 2 | right << 4 | top << 6
+VERTEX_SHIFTS = (0, 2, 4, 6)
+
+# Lookup table from a packed byte to its (left, bottom, right, top) tuple
+VERTEX_UNPACK = [tuple((packed >> shift) & 3 for shift in VERTEX_SHIFTS) for packed in range(256)]
+
+
+# The 19 valid vertex patterns, a tile's index in this list is its tile type
+TILE_TYPES = ["0000",  # Flat tile
+              "1000", "0100", "0010", "0001",  # Corner tile (up)
+              "1001", "1100", "0110", "0011",  # Slope tile
+              "1101", "1110", "0111", "1011",  # Corner tile (down)
+              "2101", "1210", "0121", "1012",  # Two height corner
+              "1010", "0101"  # "furrow" tiles
+              ]
+TILE_TYPE_VERTICES = [tuple(int(c) for c in tile_type) for tile_type in TILE_TYPES]
+# Cliff images are numbered on from the tile types, so any terrain image can be looked up with one small int
+CLIFF_TYPES = ["CL11", "CL10", "CL01", "CR11", "CR10", "CR01"]
+CL11, CL10, CL01, CR11, CR10, CR01 = range(len(TILE_TYPES), len(TILE_TYPES) + len(CLIFF_TYPES))
+# String form of every tile type, for debugging
+TILE_NAMES = TILE_TYPES + CLIFF_TYPES
+
+
+def pack_vertices(vertices):
+    """Pack a [left, bottom, right, top] vertex list into a single byte"""
+    return vertices[0] | (vertices[1] << 2) | (vertices[2] << 4) | (vertices[3] << 6)
+
+
+def unpack_vertices(packed):
+    """Unpack a vertex byte into a [left, bottom, right, top] list"""
+    return list(VERTEX_UNPACK[packed])
+
+
+def pack_vertex_array(vertices):
+    """Pack an array of shape (..., 4) into a uint8 array of shape (...)"""
+    vertices = numpy.asarray(vertices, dtype=numpy.uint8)
+    packed = numpy.zeros(vertices.shape[:-1], dtype=numpy.uint8)
+    for k, shift in enumerate(VERTEX_SHIFTS):
+        packed |= vertices[..., k] << shift
+    return packed
+
+
+def unpack_vertex_array(packed):
+    """Unpack a uint8 array of shape (...) into an array of shape (..., 4)"""
+    packed = numpy.asarray(packed, dtype=numpy.uint8)
+    return numpy.stack([(packed >> shift) & 3 for shift in VERTEX_SHIFTS], axis=-1)
+
+
+def correct_vertices(heights, vertices, fixed=0):
+    """Whole-array version of TGrid.correct_vertices, gives exactly the same result for every tile
+    heights has shape (...), vertices is unpacked with shape (..., 4) and may hold out of range values,
+    fixed is the vertex to keep fixed, either one value for all tiles or an array of shape (...)
+    Returns new (heights, vertices) arrays"""
+    heights = numpy.array(heights, dtype=numpy.int32)
+    vertices = numpy.array(vertices, dtype=numpy.int32)
+    shape = heights.shape
+    heights = heights.reshape(-1)
+    vertices = vertices.reshape(-1, 4)
+    rows = numpy.arange(len(heights))
+    fixed = numpy.broadcast_to(numpy.asarray(fixed) % 4, shape).reshape(-1)
+
+    a = vertices[rows, fixed]
+    b1 = vertices[rows, (fixed - 1) % 4]
+    b2 = vertices[rows, (fixed + 1) % 4]
+    c = vertices[rows, (fixed + 2) % 4]
+    # Target vertex must be within 0..2, anything beyond moves the tile itself
+    heights += numpy.maximum(a - 2, 0)
+    heights -= numpy.maximum(-a, 0)
+    a = numpy.clip(a, 0, 2)
+    # No more than 1 level gap between neighbouring vertices, b1 and b2 follow a, c follows b1 then b2
+    b1 = numpy.clip(b1, a - 1, a + 1)
+    b2 = numpy.clip(b2, a - 1, a + 1)
+    c = numpy.clip(c, b1 - 1, b1 + 1)
+    c = numpy.clip(c, b2 - 1, b2 + 1)
+    vertices[rows, fixed] = a
+    vertices[rows, (fixed - 1) % 4] = b1
+    vertices[rows, (fixed + 1) % 4] = b2
+    vertices[rows, (fixed + 2) % 4] = c
+    numpy.maximum(vertices, 0, out=vertices)
+    # If there's no 0 vertex the tile moves up a level
+    raised = vertices.min(axis=1) > 0
+    vertices[raised] -= 1
+    heights[raised] += 1
+    return heights.reshape(shape), vertices.reshape(shape + (4,))
+
+
+# Lookup tables between packed vertex bytes and tile types, invalid patterns have tile type -1
+TILE_TYPE_TO_PACKED = [pack_vertices(vertices) for vertices in TILE_TYPE_VERTICES]
+PACKED_TO_TILE_TYPE = [-1] * 256
+for _tile_type, _packed in enumerate(TILE_TYPE_TO_PACKED):
+    PACKED_TO_TILE_TYPE[_packed] = _tile_type
+TILE_TYPE_TO_PACKED_ARRAY = numpy.array(TILE_TYPE_TO_PACKED, dtype=numpy.uint8)
+PACKED_TO_TILE_TYPE_ARRAY = numpy.array(PACKED_TO_TILE_TYPE, dtype=numpy.int8)
+
+
+def tile_type_of(vertices):
+    """Return the tile type of a [left, bottom, right, top] vertex list, -1 if it isn't valid"""
+    return PACKED_TO_TILE_TYPE[pack_vertices(vertices)]
+
+
+class DenseStore(object):
+    """Holds the heightfield of a world as two planes,
+    an int16 tile height plane and a uint8 packed vertex plane, both indexed [x, y]
+    height_bound, if known, is a height no tile is higher than, so max_height() needn't read the whole plane"""
+
+    def __init__(self, size_x, size_y, heights=None, vertices=None, height_bound=None):
+        self.size_x = size_x
+        self.size_y = size_y
+        if heights is None:
+            heights = numpy.zeros((size_x, size_y), dtype=numpy.int16)
+        if vertices is None:
+            vertices = numpy.zeros((size_x, size_y), dtype=numpy.uint8)
+        self.heights = heights
+        self.vertices = vertices
+        self.height_bound = height_bound
+
+    def get(self, x, y):
+        """Return (height, packed vertices) of a tile"""
+        return int(self.heights[x, y]), int(self.vertices[x, y])
+
+    def set(self, x, y, height, packed):
+        """Set height and packed vertices of a tile"""
+        self.heights[x, y] = height
+        self.vertices[x, y] = packed
+
+    def read_region(self, x0, y0, x1, y1):
+        """Return (heights, packed vertices) arrays for tiles x0 <= x < x1, y0 <= y < y1"""
+        return self.heights[x0:x1, y0:y1].copy(), self.vertices[x0:x1, y0:y1].copy()
+
+    def write_region(self, x0, y0, heights, vertices):
+        """Write (heights, packed vertices) arrays with their top-left corner at x0, y0"""
+        x1 = x0 + heights.shape[0]
+        y1 = y0 + heights.shape[1]
+        self.heights[x0:x1, y0:y1] = heights
+        self.vertices[x0:x1, y0:y1] = vertices
+
+    def gather(self, xs, ys):
+        """Return (heights, packed vertices) arrays for a list of tile coordinates"""
+        return self.heights[xs, ys], self.vertices[xs, ys]
+
+    def scatter(self, xs, ys, heights, vertices):
+        """Write (heights, packed vertices) arrays to a list of tile coordinates"""
+        self.heights[xs, ys] = heights
+        self.vertices[xs, ys] = vertices
+
+    def nbytes(self):
+        """Return the memory used by the heightfield planes"""
+        return self.heights.nbytes + self.vertices.nbytes
+
+    def max_height(self):
+        """Return the height of the highest tile, or the height bound if there is one"""
+        if self.height_bound is not None:
+            return self.height_bound
+        return int(self.heights.max()) if self.heights.size else 0
+
+    def raise_height_bound(self, height):
+        """Make sure the height bound, if there is one, covers a tile just set to height"""
+        if self.height_bound is not None and height > self.height_bound:
+            self.height_bound = int(height)
+
+
+class ChunkedStore(object):
+    """Holds the heightfield of a world in fixed-size square chunks which are allocated on first write
+    Chunks which have never been written to read back as flat ground at height 0"""
+
+    CHUNK_SIZE = 64
+
+    def __init__(self, size_x, size_y, chunk_size=CHUNK_SIZE):
+        self.size_x = size_x
+        self.size_y = size_y
+        self.chunk_size = chunk_size
+        # (cx, cy) -> (heights, vertices)
+        self.chunks = {}
+
+    def get_chunk(self, cx, cy, allocate=False):
+        """Return the (heights, vertices) planes of a chunk, or None if it hasn't been allocated"""
+        chunk = self.chunks.get((cx, cy))
+        if chunk is None and allocate:
+            chunk = (numpy.zeros((self.chunk_size, self.chunk_size), dtype=numpy.int16),
+                     numpy.zeros((self.chunk_size, self.chunk_size), dtype=numpy.uint8))
+            self.chunks[(cx, cy)] = chunk
+        return chunk
+
+    def get(self, x, y):
+        """Return (height, packed vertices) of a tile"""
+        cs = self.chunk_size
+        chunk = self.chunks.get((x // cs, y // cs))
+        if chunk is None:
+            return 0, 0
+        return int(chunk[0][x % cs, y % cs]), int(chunk[1][x % cs, y % cs])
+
+    def set(self, x, y, height, packed):
+        """Set height and packed vertices of a tile"""
+        cs = self.chunk_size
+        # Writing flat ground into an untouched chunk doesn't need it allocating
+        chunk = self.get_chunk(x // cs, y // cs, allocate=bool(height or packed))
+        if chunk is not None:
+            chunk[0][x % cs, y % cs] = height
+            chunk[1][x % cs, y % cs] = packed
+
+    def chunks_in_region(self, x0, y0, x1, y1):
+        """Yield (cx, cy, chunk slice, region slice) for each chunk overlapping a region"""
+        cs = self.chunk_size
+        for cx in range(x0 // cs, (x1 - 1) // cs + 1):
+            for cy in range(y0 // cs, (y1 - 1) // cs + 1):
+                ax = max(x0, cx * cs)
+                bx = min(x1, (cx + 1) * cs)
+                ay = max(y0, cy * cs)
+                by = min(y1, (cy + 1) * cs)
+                yield (cx, cy,
+                       (slice(ax - cx * cs, bx - cx * cs), slice(ay - cy * cs, by - cy * cs)),
+                       (slice(ax - x0, bx - x0), slice(ay - y0, by - y0)))
+
+    def read_region(self, x0, y0, x1, y1):
+        """Return (heights, packed vertices) arrays for tiles x0 <= x < x1, y0 <= y < y1"""
+        heights = numpy.zeros((x1 - x0, y1 - y0), dtype=numpy.int16)
+        vertices = numpy.zeros((x1 - x0, y1 - y0), dtype=numpy.uint8)
+        if x1 > x0 and y1 > y0:
+            for cx, cy, inner, outer in self.chunks_in_region(x0, y0, x1, y1):
+                chunk = self.chunks.get((cx, cy))
+                if chunk is not None:
+                    heights[outer] = chunk[0][inner]
+                    vertices[outer] = chunk[1][inner]
+        return heights, vertices
+
+    def write_region(self, x0, y0, heights, vertices):
+        """Write (heights, packed vertices) arrays with their top-left corner at x0, y0"""
+        x1 = x0 + heights.shape[0]
+        y1 = y0 + heights.shape[1]
+        if x1 > x0 and y1 > y0:
+            for cx, cy, inner, outer in self.chunks_in_region(x0, y0, x1, y1):
+                allocate = bool(heights[outer].any() or vertices[outer].any())
+                chunk = self.get_chunk(cx, cy, allocate=allocate)
+                if chunk is not None:
+                    chunk[0][inner] = heights[outer]
+                    chunk[1][inner] = vertices[outer]
+
+    def group_by_chunk(self, xs, ys):
+        """Yield (cx, cy, indices) grouping a list of tile coordinates by the chunk they fall in"""
+        cs = self.chunk_size
+        xs = numpy.asarray(xs)
+        ys = numpy.asarray(ys)
+        keys = (xs // cs) * ((self.size_y - 1) // cs + 1) + ys // cs
+        order = numpy.argsort(keys, kind="mergesort")
+        unique_keys, starts = numpy.unique(keys[order], return_index=True)
+        ends = list(starts[1:]) + [len(order)]
+        for key, start, end in zip(unique_keys, starts, ends):
+            indices = order[start:end]
+            yield int(xs[indices[0]] // cs), int(ys[indices[0]] // cs), indices
+
+    def gather(self, xs, ys):
+        """Return (heights, packed vertices) arrays for a list of tile coordinates"""
+        cs = self.chunk_size
+        xs = numpy.asarray(xs)
+        ys = numpy.asarray(ys)
+        heights = numpy.zeros(len(xs), dtype=numpy.int16)
+        vertices = numpy.zeros(len(xs), dtype=numpy.uint8)
+        for cx, cy, indices in self.group_by_chunk(xs, ys):
+            chunk = self.chunks.get((cx, cy))
+            if chunk is not None:
+                heights[indices] = chunk[0][xs[indices] % cs, ys[indices] % cs]
+                vertices[indices] = chunk[1][xs[indices] % cs, ys[indices] % cs]
+        return heights, vertices
+
+    def scatter(self, xs, ys, heights, vertices):
+        """Write (heights, packed vertices) arrays to a list of tile coordinates"""
+        cs = self.chunk_size
+        xs = numpy.asarray(xs)
+        ys = numpy.asarray(ys)
+        heights = numpy.asarray(heights)
+        vertices = numpy.asarray(vertices)
+        for cx, cy, indices in self.group_by_chunk(xs, ys):
+            allocate = bool(heights[indices].any() or vertices[indices].any())
+            chunk = self.get_chunk(cx, cy, allocate=allocate)
+            if chunk is not None:
+                chunk[0][xs[indices] % cs, ys[indices] % cs] = heights[indices]
+                chunk[1][xs[indices] % cs, ys[indices] % cs] = vertices[indices]
+
+    def nbytes(self):
+        """Return the memory used by the allocated chunks"""
+        return sum(h.nbytes + v.nbytes for h, v in self.chunks.values())
+
+    def max_height(self):
+        """Return the height of the highest tile, unallocated chunks are all at 0"""
+        return max([int(h.max()) for h, v in self.chunks.values()] + [0])
+
+    def raise_height_bound(self, height):
+        """Nothing to do, max_height() only reads the allocated chunks"""
+        pass
+
+
+def from_tile_map(tile_map):
+    """Build a DenseStore and a path dict from a list-style tile map, correcting any invalid tiles
+    Tile structure [height, vertexheight[left, bottom, right, top], [path_start, path_end]]"""
+    size_x = len(tile_map)
+    size_y = len(tile_map[0])
+    heights, vertices = correct_vertices([[tile[0] for tile in row] for row in tile_map],
+                                         [[tile[1] for tile in row] for row in tile_map])
+    heights = heights.astype(numpy.int16)
+    vertices = pack_vertex_array(vertices)
+    paths = {}
+    for x, row in enumerate(tile_map):
+        for y, tile in enumerate(row):
+            if len(tile) >= 3:
+                paths[(x, y)] = [list(path) for path in tile[2]]
+    return DenseStore(size_x, size_y, heights, vertices), paths
+
+
+class TileArrayView(object):
+    """List-style view over a store, so that array[x][y] gives
+    [height, [left, bottom, right, top], paths] like the old nested World.array
+    Tiles are built on access, writes must go through World.set_height/add_path"""
+
+    def __init__(self, store, paths):
+        self.store = store
+        self.paths = paths
+
+    def __len__(self):
+        return self.store.size_x
+
+    def __getitem__(self, x):
+        if x < 0:
+            x += self.store.size_x
+        if x < 0 or x >= self.store.size_x:
+            raise IndexError("tile index out of range")
+        return TileRowView(self, x)
+
+
+class TileRowView(object):
+    """Single row of a TileArrayView"""
+
+    def __init__(self, view, x):
+        self.view = view
+        self.x = x
+
+    def __len__(self):
+        return self.view.store.size_y
+
+    def __getitem__(self, y):
+        store = self.view.store
+        if y < 0:
+            y += store.size_y
+        if y < 0 or y >= store.size_y:
+            raise IndexError("tile index out of range")
+        height, packed = store.get(self.x, y)
+        tile = [height, unpack_vertices(packed)]
+        if (self.x, y) in self.view.paths:
+            tile.append(self.view.paths[(self.x, y)])
+        return tile
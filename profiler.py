@@ -0,0 +1,111 @@
+import collections
+import contextlib
+import json
+import time
+
+import numpy
+
+
+class FrameProfiler(object):
+    """Times the phases of every frame of the main loop and counts the work done during it
+    Phase times add up over a frame, a phase run while handling events counts towards both. The last window
+    frames are kept for percentiles, and every frame can be written to a JSON lines file as it ends."""
+
+    PHASES = ["events", "mouse_move", "update_world", "paint_world", "draw", "display_update"]
+    COUNTERS = ["sprites_created", "surfaces_allocated", "tiles_repainted", "dirty_rects"]
+    PERCENTILES = (50, 95, 99)
+    WINDOW = 300
+
+    # The profiler of the running main loop, which count() adds to
+    active = None
+
+    def __init__(self, window=WINDOW, log_path=None):
+        self.window = window
+        self.frame = 0
+        self.frame_start = None
+        # Seconds spent in each phase and counts of work done so far this frame
+        self.times = {}
+        self.counts = {}
+        self.started = {}
+        # Phase and frame times in ms, and counts, of the last window frames
+        self.history = {name: collections.deque(maxlen=window) for name in ["frame"] + self.PHASES + self.COUNTERS}
+        self.log = open(log_path, "a") if log_path else None
+
+    def begin_frame(self):
+        """Start timing a frame"""
+        self.frame_start = time.perf_counter()
+        self.times = {}
+        self.counts = {}
+        self.started = {}
+
+    def start(self, phase):
+        """Start timing a phase of the frame"""
+        self.started[phase] = time.perf_counter()
+
+    def stop(self, phase):
+        """Stop timing a phase, adding the time to any it's had already this frame"""
+        self.times[phase] = self.times.get(phase, 0.0) + time.perf_counter() - self.started.pop(phase)
+
+    @contextlib.contextmanager
+    def timed(self, phase):
+        """Time the body of a with statement as a phase"""
+        self.start(phase)
+        try:
+            yield
+        finally:
+            self.stop(phase)
+
+    def count(self, counter, n=1):
+        """Add to one of the counts of work done this frame"""
+        self.counts[counter] = self.counts.get(counter, 0) + n
+
+    def end_frame(self):
+        """Finish timing a frame, returns its record"""
+        if self.frame_start is None:
+            return None
+        record = {"frame": self.frame, "frame_ms": (time.perf_counter() - self.frame_start) * 1000.0}
+        self.history["frame"].append(record["frame_ms"])
+        for phase in self.PHASES:
+            record[phase] = self.times.get(phase, 0.0) * 1000.0
+            self.history[phase].append(record[phase])
+        for counter in self.COUNTERS:
+            record[counter] = self.counts.get(counter, 0)
+            self.history[counter].append(record[counter])
+        if self.log:
+            self.log.write(json.dumps(record) + "\n")
+        self.frame += 1
+        self.frame_start = None
+        return record
+
+    def percentiles(self, name):
+        """Return the PERCENTILES of a phase, the frame time or a count over the window"""
+        values = self.history[name]
+        if not values:
+            return [0.0] * len(self.PERCENTILES)
+        return [float(v) for v in numpy.percentile(numpy.array(values), self.PERCENTILES)]
+
+    def summary(self):
+        """Return the percentiles of everything over the window as a dict"""
+        return {name: dict(zip(["p%i" % pc for pc in self.PERCENTILES], self.percentiles(name)))
+                for name in self.history}
+
+    def text_lines(self):
+        """Return the percentiles as lines of text, for an overlay"""
+        lines = ["%-16s %s" % ("ms / count", "  ".join("p%-6i" % pc for pc in self.PERCENTILES))]
+        for name in ["frame"] + self.PHASES:
+            lines.append("%-16s %s" % (name, "  ".join("%7.2f" % v for v in self.percentiles(name))))
+        for name in self.COUNTERS:
+            lines.append("%-16s %s" % (name, "  ".join("%7i" % v for v in self.percentiles(name))))
+        return lines
+
+    def close(self):
+        """Stop writing to the log"""
+        if self.log:
+            self.log.close()
+            self.log = None
+
+
+def count(counter, n=1):
+    """Add to a count of the active profiler, if there is one"""
+    if FrameProfiler.active is not None:
+        FrameProfiler.active.count(counter, n)
@@ -1,8 +1,13 @@
-import math
+import collections
+import os
 import sys
 
+import numpy
 import pygame
 
+import heightfield
+import profiler
+import render
 import tools
 import world
 from text_sprite import TextSprite
@@ -19,12 +24,130 @@ p16 = int(p / 16)
 ph = 8
 
 
+# Highlight images are cut from rows 3 to 7 of the texture, image numbers follow the order of these keys
+HIGHLIGHT_IMAGES_KEYS = [
+    (["None"], 3),
+    (["00XX", "01XX", "10XX", "11XX", "12XX", "21XX", "22XX"], 4),  # bottom-left edge
+    (["X00X", "X01X", "X10X", "X11X", "X12X", "X21X", "X22X"], 5),  # bottom-right edge
+    (["XX00", "XX01", "XX10", "XX11", "XX12", "XX21", "XX22"], 6),  # top-right edge
+    (["0XX0", "1XX0", "0XX1", "1XX1", "2XX1", "1XX2", "2XX2"], 7),  # top-left edge
+]
+HIGHLIGHT_KEYS = [key for keys, row in HIGHLIGHT_IMAGES_KEYS for key in keys]
+
+
+def build_highlight_info():
+    """Work out which highlight images make up the highlight of every tile type and subtile
+    Returns highlight_info[tile_type][subtile] -> [(highlight image number, dest, area), ...]"""
+    highlight_info = []
+    for tile_type in heightfield.TILE_TYPES:
+        by_subtile = []
+        for type_ in range(10):
+            if type_ == 0:
+                sprite_info = []  # Empty Image
+            # Corner bits, made up of two images
+            elif type_ == 1:
+                sprite_info = [
+                    ("%sXX%s" % (tile_type[0], tile_type[3]), (0, 0), (0, 0, p4, p)),
+                    ("%s%sXX" % (tile_type[0], tile_type[1]), (0, 0), (0, 0, p4, p))
+                ]
+            elif type_ == 2:
+                sprite_info = [
+                    ("%s%sXX" % (tile_type[0], tile_type[1]), (p4, 0), (p4, 0, p2, p)),
+                    ("X%s%sX" % (tile_type[1], tile_type[2]), (p4, 0), (p4, 0, p2, p))
+                ]
+            elif type_ == 3:
+                sprite_info = [
+                    ("X%s%sX" % (tile_type[1], tile_type[2]), (p4x3, 0), (p4x3, 0, p4, p)),
+                    ("XX%s%s" % (tile_type[2], tile_type[3]), (p4x3, 0), (p4x3, 0, p4, p))
+                ]
+            elif type_ == 4:
+                sprite_info = [
+                    ("XX%s%s" % (tile_type[2], tile_type[3]), (p4, 0), (p4, 0, p2, p)),
+                    ("%sXX%s" % (tile_type[0], tile_type[3]), (p4, 0), (p4, 0, p2, p))
+                ]
+            # Edge bits, made up of one image
+            elif type_ == 5:
+                sprite_info = [
+                    ("%s%sXX" % (tile_type[0], tile_type[1]), (0, 0), None)
+                ]
+            elif type_ == 6:
+                sprite_info = [
+                    ("X%s%sX" % (tile_type[1], tile_type[2]), (0, 0), None)
+                ]
+            elif type_ == 7:
+                sprite_info = [
+                    ("XX%s%s" % (tile_type[2], tile_type[3]), (0, 0), None)
+                ]
+            elif type_ == 8:
+                sprite_info = [
+                    ("%sXX%s" % (tile_type[0], tile_type[3]), (0, 0), None)
+                ]
+            else:
+                # Otherwise highlight whole tile (4 images)
+                sprite_info = [
+                    ("%s%sXX" % (tile_type[0], tile_type[1]), (0, 0), None),
+                    ("X%s%sX" % (tile_type[1], tile_type[2]), (0, 0), None),
+                    ("XX%s%s" % (tile_type[2], tile_type[3]), (0, 0), None),
+                    ("%sXX%s" % (tile_type[0], tile_type[3]), (0, 0), None),
+                ]
+            by_subtile.append([(HIGHLIGHT_KEYS.index(img_key), dest, area) for img_key, dest, area in sprite_info])
+        highlight_info.append(by_subtile)
+    return highlight_info
+
+
+class HighlightCache(object):
+    """Bounded cache of highlighted tile images and their masks, keyed by (tile type, subtile)
+    The least recently used image is dropped when the cache is full"""
+
+    # Room for every tile type with every subtile highlighted
+    MAX_SIZE = len(heightfield.TILE_TYPES) * 10
+
+    def __init__(self, max_size=MAX_SIZE):
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, tile_type, subtile):
+        """Return (image, mask) of a tile type with the highlight for a subtile, composing it if needed"""
+        key = (tile_type, subtile)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+        self.misses += 1
+        entry = (TileSprite.compose_highlight(tile_type, subtile), TileSprite.highlight_masks[tile_type][subtile])
+        self.entries[key] = entry
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+    def clear(self):
+        """Drop all the cached images"""
+        self.entries.clear()
+
+    def stats(self):
+        """Return the cache statistics as a dict"""
+        return {"size": len(self.entries), "max_size": self.max_size, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
+
+
 class TileSprite(pygame.sprite.Sprite):
     """Ground tiles"""
     image = None
+    mask = None
     kind = "tile"
-    tile_images = dict()
-    highlight_images = dict()
+    # Both indexed by tile type/highlight image number once loaded
+    tile_images = []
+    highlight_images = []
+    # Masks of the tile images, and of every tile type with every highlight, highlight_masks[tile_type][subtile]
+    tile_masks = []
+    highlight_masks = []
+    # highlight_info[tile_type][subtile] -> [(highlight image number, dest, area), ...]
+    highlight_info = None
 
     def __init__(self, world, type_, x_world, y_world, z_world, exclude=False):
         super().__init__()
@@ -32,34 +155,37 @@ class TileSprite(pygame.sprite.Sprite):
             ground_image = pygame.image.load("textures.png")
             TileSprite.image = ground_image.convert()
 
+            # Tile images are indexed by tile type, with the cliff images numbered on from the tiles
             tile_images_keys = [
-                (["CL11", "CL10", "CL01", "CR11", "CR10", "CR01"], 2),  # Left and Right cliff images
-                (["0000",  # Flat tile
-                  "1000", "0100", "0010", "0001",  # Corner tile (up)
-                  "1001", "1100", "0110", "0011",  # Slope tile
-                  "1101", "1110", "0111", "1011",  # Corner tile (down)
-                  "2101", "1210", "0121", "1012",  # Two height corner
-                  "1010", "0101"  # "furrow" tiles
-                  ], 0)
+                (heightfield.CLIFF_TYPES, 2),  # Left and Right cliff images
+                (heightfield.TILE_TYPES, 0)
             ]
+            TileSprite.tile_images = [None] * len(heightfield.TILE_NAMES)
             # Tile images will be composited using rendering later, for now just read them in
             for item in tile_images_keys:
                 for idx, key in enumerate(item[0]):
-                    TileSprite.tile_images[key] = self.create_subsurface((idx * p, item[1] * p, p, p))
-
-            # Now add the highlight_images
-            highlight_images_keys = [
-                (["None"], 3),
-                (["00XX", "01XX", "10XX", "11XX", "12XX", "21XX", "22XX"], 4),  # bottom-left edge
-                (["X00X", "X01X", "X10X", "X11X", "X12X", "X21X", "X22X"], 5),  # bottom-right edge
-                (["XX00", "XX01", "XX10", "XX11", "XX12", "XX21", "XX22"], 6),  # top-right edge
-                (["0XX0", "1XX0", "0XX1", "1XX1", "2XX1", "1XX2", "2XX2"], 7),  # top-left edge
-            ]
+                    TileSprite.tile_images[heightfield.TILE_NAMES.index(key)] = self.create_subsurface(
+                        (idx * p, item[1] * p, p, p))
 
-            for item in highlight_images_keys:
+            # Now add the highlight_images, in the order of HIGHLIGHT_KEYS
+            TileSprite.highlight_images = []
+            for item in HIGHLIGHT_IMAGES_KEYS:
                 for idx, key in enumerate(item[0]):
-                    TileSprite.highlight_images[key] = self.create_subsurface((idx * p, item[1] * p, p, p))
+                    TileSprite.highlight_images.append(self.create_subsurface((idx * p, item[1] * p, p, p)))
 
+            # Collision masks are made once here and shared by all the sprites using the same image
+            TileSprite.tile_masks = [pygame.mask.from_surface(image) for image in TileSprite.tile_images]
+            TileSprite.highlight_masks = [
+                [pygame.mask.from_surface(self.compose_highlight(tile_type, subtile)) for subtile in range(10)]
+                for tile_type in range(len(heightfield.TILE_TYPES))]
+            # Tools pick tiles using the shapes of the tile images
+            tools.Tool.tile_masks = TileSprite.tile_masks
+
+        self.world = world
+        self.reset(type_, x_world, y_world, z_world, exclude)
+
+    def reset(self, type_, x_world, y_world, z_world, exclude=False):
+        """Set this sprite up to show a tile or cliff, so that sprites can be reused"""
         self.exclude = exclude
         # x,y,zdim are the global 3D world dimensions of the object
         self.x_dim = 1.0
@@ -75,7 +201,6 @@ class TileSprite(pygame.sprite.Sprite):
         self.x_pos = None
         self.y_pos = None
         self.rect = None
-        self.world = world
 
         self.update()
 
@@ -95,105 +220,78 @@ class TileSprite(pygame.sprite.Sprite):
         # Global screen positions
         self.x_pos = self.world.WorldWidth2 - (x * p2) + (y * p2) - p2
         self.y_pos = (x * p4) + (y * p4) - (z * ph)
-        # Rect position takes into account the offset
-        self.rect = (self.x_pos - self.world.dxoff, self.y_pos - self.world.dyoff, p, p)
+        # The rect is within the whole world image, the offset is applied when drawing (see render.DrawList)
+        self.rect = (self.x_pos, self.y_pos, p, p)
         return self.rect
 
     def update_xyz(self):
         """Update xyz coords to match those in the array"""
-        self.z_world = self.world.array[self.x_world][self.y_world][0]
+        self.z_world = self.world.get_tile(self.x_world, self.y_world)[0]
         return self.calc_rect()
 
     def update_type(self):
         """Update type to match those in the array"""
-        self.type = self.array_to_string(self.world.array[self.x_world][self.y_world][1])
+        self.type = self.world.get_tile_type(self.x_world, self.y_world)
 
     def update(self):
         """Update sprite's rect and other attributes"""
         # What tile type should this tile be?
         self.image = TileSprite.tile_images[self.type]
+        self.mask = TileSprite.tile_masks[self.type]
         self.calc_rect()
 
-    def change_highlight(self, type_):
-        """Update this tile's image with a highlight"""
-        tile_type = self.type
-
+    @staticmethod
+    def compose_highlight(tile_type, subtile):
+        """Return a new image of a tile type with the highlight for a subtile drawn over it"""
         image = pygame.Surface((p, p))
+        profiler.count("surfaces_allocated")
         image.fill((231, 255, 255))
         image.blit(TileSprite.tile_images[tile_type], (0, 0))
-
-        if type_ == 0:
-            sprite_info = []  # Empty Image
-        # Corner bits, made up of two images
-        elif type_ == 1:
-            sprite_info = [
-                ("%sXX%s" % (tile_type[0], tile_type[3]), (0, 0), (0, 0, p4, p)),
-                ("%s%sXX" % (tile_type[0], tile_type[1]), (0, 0), (0, 0, p4, p))
-            ]
-        elif type_ == 2:
-            sprite_info = [
-                ("%s%sXX" % (tile_type[0], tile_type[1]), (p4, 0), (p4, 0, p2, p)),
-                ("X%s%sX" % (tile_type[1], tile_type[2]), (p4, 0), (p4, 0, p2, p))
-            ]
-        elif type_ == 3:
-            sprite_info = [
-                ("X%s%sX" % (tile_type[1], tile_type[2]), (p4x3, 0), (p4x3, 0, p4, p)),
-                ("XX%s%s" % (tile_type[2], tile_type[3]), (p4x3, 0), (p4x3, 0, p4, p))
-            ]
-        elif type_ == 4:
-            sprite_info = [
-                ("XX%s%s" % (tile_type[2], tile_type[3]), (p4, 0), (p4, 0, p2, p)),
-                ("%sXX%s" % (tile_type[0], tile_type[3]), (p4, 0), (p4, 0, p2, p))
-            ]
-        # Edge bits, made up of one image
-        elif type_ == 5:
-            sprite_info = [
-                ("%s%sXX" % (tile_type[0], tile_type[1]), (0, 0), None)
-            ]
-        elif type_ == 6:
-            sprite_info = [
-                ("X%s%sX" % (tile_type[1], tile_type[2]), (0, 0), None)
-            ]
-        elif type_ == 7:
-            sprite_info = [
-                ("XX%s%s" % (tile_type[2], tile_type[3]), (0, 0), None)
-            ]
-        elif type_ == 8:
-            sprite_info = [
-                ("%sXX%s" % (tile_type[0], tile_type[3]), (0, 0), None)
-            ]
-        else:
-            # Otherwise highlight whole tile (4 images)
-            sprite_info = [
-                ("%s%sXX" % (tile_type[0], tile_type[1]), (0, 0), None),
-                ("X%s%sX" % (tile_type[1], tile_type[2]), (0, 0), None),
-                ("XX%s%s" % (tile_type[2], tile_type[3]), (0, 0), None),
-                ("%sXX%s" % (tile_type[0], tile_type[3]), (0, 0), None),
-            ]
-
-        for img_key, dest, area in sprite_info:
-            image.blit(TileSprite.highlight_images[img_key], dest, area)
-
+        for img_idx, dest, area in TileSprite.highlight_info[tile_type][subtile]:
+            image.blit(TileSprite.highlight_images[img_idx], dest, area)
         image.set_colorkey((231, 255, 255), pygame.RLEACCEL)
+        return image
 
-        self.image = image
-        self.mask = pygame.mask.from_surface(self.image)
+    def change_highlight(self, type_):
+        """Update this tile's image with a highlight"""
+        if type_ is None or not 0 <= type_ <= 9:
+            # Otherwise highlight whole tile
+            type_ = 9
+        self.image, self.mask = TileSprite.highlight_cache.get(self.type, type_)
 
         return self.rect
 
     @staticmethod
     def array_to_string(array):
-        """Convert a heightfield array to a string"""
+        """Convert a heightfield array to a string, for debugging"""
         return "{}{}{}{}".format(*array)
 
 
+TileSprite.highlight_info = build_highlight_info()
+# Highlighted images are shared by all the sprites showing the same tile type and highlight
+TileSprite.highlight_cache = HighlightCache()
+
+
 class DisplayMain(object):
     """This handles the main initialisation
     and startup for the display"""
 
     FPS_REFRESH = 500
+    # Frame rate cap while the screen is changing
+    MAX_FPS = 60
+    # Largest image render_view will draw in one go, 256MB at 32 bits a pixel
+    MAX_RENDER_PIXELS = 1 << 26
+
+    def __init__(self, width, height, world, chunk_size=None, max_fps=MAX_FPS, benchmark=False, profile_log=None,
+                 headless=False):
+        # Without a window, SDL's dummy video driver still lets images be converted for fast blitting
+        self.headless = headless
+        if headless:
+            # The driver is only picked when the display starts, so one already running on another has to stop
+            if pygame.display.get_init() and pygame.display.get_driver() != "dummy":
+                pygame.display.quit()
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
 
-    def __init__(self, width, height, world):
         # Initialize PyGame
         pygame.init()
 
@@ -204,8 +302,12 @@ class DisplayMain(object):
         self.screen_width = width
         self.screen_height = height
 
-        # Create the Screen
-        self.screen = pygame.display.set_mode((self.screen_width, self.screen_height), pygame.RESIZABLE)
+        # Create the Screen, headless it's an offscreen surface
+        if headless:
+            pygame.display.set_mode((1, 1))
+            self.screen = pygame.Surface((self.screen_width, self.screen_height)).convert()
+        else:
+            self.screen = pygame.display.set_mode((self.screen_width, self.screen_height), pygame.RESIZABLE)
 
         # tell pygame to keep sending up keystrokes when they are held down
         pygame.key.set_repeat(500, 30)
@@ -215,7 +317,8 @@ class DisplayMain(object):
 
         self.refresh_screen = True
 
-        self.ordered_sprites = pygame.sprite.LayeredUpdates()
+        # Sprites of each tile in view (the tile and its cliffs) are kept under (x, y) at their layer
+        self.ordered_sprites = render.DrawList(world)
         self.ordered_sprites_dict = {}
 
         # Sprite used to find what the cursor is selecting
@@ -223,6 +326,14 @@ class DisplayMain(object):
         # Settings for FPS counter
         self.fps_refresh = DisplayMain.FPS_REFRESH
         self.fps_elapsed = 0
+        # Frames are capped at max_fps, and while nothing is happening the loop sleeps until there's some input
+        # In benchmark mode frames are uncapped and the whole screen is redrawn every frame
+        self.max_fps = max_fps
+        self.benchmark = benchmark
+        # Times the phases of each frame, written to profile_log as JSON lines if given, F3 shows them on screen
+        self.profiler = profiler.FrameProfiler(log_path=profile_log)
+        profiler.FrameProfiler.active = self.profiler
+        self.profile_sprite = None
         # Associated with user input
         self.last_mouse_position = pygame.mouse.get_pos()
 
@@ -247,117 +358,319 @@ class DisplayMain(object):
             bg=(255, 255, 255),
             bold=False)
         self.overlay_sprites.add(self.active_tool_sprite, layer=100)
+        self.profile_font = pygame.font.Font(None, 16)
 
         # Clear the stack of dirty tiles
-        self.dirty = []
+        self.dirty = render.DirtyRegion(self.screen_width, self.screen_height)
+
+        # Sprites no longer in use, kept to be reused rather than making new ones
+        self.sprite_pool = []
 
         self.world = world
 
+        # Highlight the world was last drawn with
+        self.highlight = None
+        # World offset the screen was last drawn at, and whether it's been scrolled since the last update
+        self.drawn_offset = None
+        self.scrolled = False
+        # With a chunk size the world is drawn as prerendered chunks of tiles, see render.ChunkRenderer
+        self.chunks = None
+        if chunk_size:
+            self.chunks = render.ChunkRenderer(self.world, self.make_tile_sprites, chunk_size)
+
     def main_loop(self):
         """This is the Main Loop of the Game"""
         while True:
-            self.clock.tick(0)
+            if self.benchmark:
+                self.clock.tick(0)
+                self.refresh_screen = True
+            else:
+                self.clock.tick(self.max_fps)
+
+            if self.is_idle():
+                # Nothing changes until there's some input, so wait for it rather than spinning
+                events = [pygame.event.wait()] + pygame.event.get()
+            else:
+                events = pygame.event.get()
+
             # If there's a quit event, don't bother parsing the event queue
-            if pygame.event.peek(pygame.QUIT):
-                pygame.display.quit()
-                sys.exit()
-
-            for event in pygame.event.get():
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_F12:
-                        pygame.image.save(self.screen, "pytile_sc.png")
-                    if not self.lmb_tool.process_key(event.key):
-                        # process_key() will always return False if it hasn't processed the key,
-                        # so that keys can be used for other things if a tool doesn't want them
-                        if event.key == pygame.K_h:
-                            # Activate terrain modification mode
-                            self.lmb_tool = tools.Terrain()
-                            self.active_tool_sprite.text_lines = ["Terrain modification"]
-                            self.dirty.append(self.active_tool_sprite.update())
-
-                        # Some tools may use the escape key
-                        if event.key == pygame.K_ESCAPE:
-                            pygame.display.quit()
-                            sys.exit()
-
-                if event.type == pygame.MOUSEBUTTONDOWN:
-                    # LMB
-                    if event.button == 1:
-                        self.lmb_tool.mouse_down(event.pos, self.ordered_sprites)
-                    # RMB
-                    if event.button == 3:
-                        self.rmb_tool.mouse_down(event.pos, self.ordered_sprites)
-                if event.type == pygame.MOUSEBUTTONUP:
-                    # LMB
-                    if event.button == 1:
-                        self.lmb_tool.mouse_up(event.pos, self.ordered_sprites)
-                    # RMB
-                    if event.button == 3:
-                        self.rmb_tool.mouse_up(event.pos, self.ordered_sprites)
-                if event.type == pygame.MOUSEMOTION:
-                    # LMB is pressed, update all the time to keep highlight working
-                    self.lmb_tool.mouse_move(event.pos, self.ordered_sprites)
-                    # RMB is pressed, only update while RMB pressed
-                    if event.buttons[2] == 1:
-                        self.rmb_tool.mouse_move(event.pos, self.ordered_sprites)
-                if event.type == pygame.VIDEORESIZE:
-                    self.screen_width = event.w
-                    self.screen_height = event.h
-                    self.screen = pygame.display.set_mode((self.screen_width, self.screen_height), pygame.RESIZABLE)
-                    self.paint_world()
-                    self.refresh_screen = True
-
-            if self.lmb_tool.has_aoe_changed():
-                # Update the screen to reflect changes made by tools
-                aoe = self.lmb_tool.get_last_aoe() + self.lmb_tool.get_aoe()
+            if any(event.type == pygame.QUIT for event in events):
+                self.quit()
+
+            self.run_frame(events)
+
+    def run_frame(self, events):
+        """Handle a frame's worth of events, then update and draw the screen, returns the frame's timings"""
+        self.profiler.begin_frame()
+        self.profiler.start("events")
+        for event in self.coalesce_events(events):
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_F12:
+                    pygame.image.save(self.screen, "pytile_sc.png")
+                if event.key == pygame.K_F3:
+                    self.toggle_profile()
+                if not self.lmb_tool.process_key(event.key):
+                    # process_key() will always return False if it hasn't processed the key,
+                    # so that keys can be used for other things if a tool doesn't want them
+                    if event.key == pygame.K_h:
+                        # Activate terrain modification mode
+                        self.lmb_tool = tools.Terrain()
+                        self.active_tool_sprite.text_lines = ["Terrain modification"]
+                        self.dirty.append(self.active_tool_sprite.update())
+
+                    # Switch between drawing tile by tile and drawing prerendered chunks
+                    if event.key == pygame.K_c:
+                        self.set_chunk_size(None if self.chunks else render.ChunkRenderer.CHUNK_SIZE)
+
+                    # Undo with Ctrl+Z, redo with Ctrl+Y or Ctrl+Shift+Z
+                    if event.mod & pygame.KMOD_CTRL:
+                        if event.key == pygame.K_z and not event.mod & pygame.KMOD_SHIFT:
+                            with self.profiler.timed("update_world"):
+                                self.update_history(self.world.undo())
+                        elif event.key == pygame.K_y or event.key == pygame.K_z:
+                            with self.profiler.timed("update_world"):
+                                self.update_history(self.world.redo())
+
+                    # Some tools may use the escape key
+                    if event.key == pygame.K_ESCAPE:
+                        self.quit()
+
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                # LMB
+                if event.button == 1:
+                    self.lmb_tool.mouse_down(event.pos, self.ordered_sprites)
+                # RMB
+                if event.button == 3:
+                    self.rmb_tool.mouse_down(event.pos, self.ordered_sprites)
+            if event.type == pygame.MOUSEBUTTONUP:
+                # LMB
+                if event.button == 1:
+                    self.lmb_tool.mouse_up(event.pos, self.ordered_sprites)
+                # RMB
+                if event.button == 3:
+                    self.rmb_tool.mouse_up(event.pos, self.ordered_sprites)
+            if event.type == pygame.MOUSEMOTION:
+                self.profiler.start("mouse_move")
+                # LMB is pressed, update all the time to keep highlight working
+                self.lmb_tool.mouse_move(event.pos, self.ordered_sprites)
+                # RMB is pressed, only update while RMB pressed
+                if event.buttons[2] == 1:
+                    self.rmb_tool.mouse_move(event.pos, self.ordered_sprites)
+                self.profiler.stop("mouse_move")
+            if event.type == pygame.VIDEORESIZE:
+                with self.profiler.timed("paint_world"):
+                    self.resize(event.w, event.h)
+        self.profiler.stop("events")
+
+        # Tools act on the input once per frame, however many events there were
+        with self.profiler.timed("mouse_move"):
+            self.lmb_tool.update()
+            self.rmb_tool.update()
+
+        edited = False
+        if self.lmb_tool.has_aoe_changed():
+            # Update the screen to reflect changes made by tools
+            aoe = self.lmb_tool.get_last_aoe() + self.lmb_tool.get_aoe()
+            with self.profiler.timed("update_world"):
                 self.update_world(aoe, self.lmb_tool.get_highlight())
-                self.lmb_tool.set_aoe_changed(False)
-                self.lmb_tool.clear_aoe()
+            self.lmb_tool.set_aoe_changed(False)
+            self.lmb_tool.clear_aoe()
+            edited = True
+
+        if self.view_moved():
+            # Scroll what's already on the screen, unless it has to be redrawn anyway
+            refresh = self.refresh_screen or edited
+            with self.profiler.timed("paint_world"):
+                self.paint_world(self.highlight)
+            with self.profiler.timed("draw"):
+                self.refresh_screen = refresh or not self.scroll_view()
+
+        # Write some useful info on the top bar
+        self.fps_elapsed += self.clock.get_time()
+        if self.fps_elapsed >= self.fps_refresh:
+            self.fps_elapsed = 0
+            ii = self.lmb_tool.tile
+            if ii:
+                layer = self.get_layer(ii.x_world, ii.y_world)
+                pygame.display.set_caption(
+                    "FPS: %i | Tile: (%s,%s) of type: %s, layer: %s | dxoff: %s dyoff: %s" %
+                    (self.clock.get_fps(), ii.x_world, ii.y_world, heightfield.TILE_NAMES[ii.type], layer,
+                     self.world.dxoff, self.world.dyoff))
+            else:
+                pygame.display.set_caption(
+                    "FPS: %i | dxoff: %s dyoff: %s" %
+                    (self.clock.get_fps(), self.world.dxoff, self.world.dyoff))
+            if self.profile_sprite:
+                self.profile_sprite.text_lines = self.profiler.text_lines()
+                self.dirty.append(self.profile_sprite.update())
+
+        self.draw_frame()
+        return self.profiler.end_frame()
+
+    def resize(self, width, height):
+        """Change the size of the screen, and paint what can be seen in it"""
+        self.screen_width = width
+        self.screen_height = height
+        if self.headless:
+            self.screen = pygame.Surface((self.screen_width, self.screen_height)).convert()
+        else:
+            self.screen = pygame.display.set_mode((self.screen_width, self.screen_height), pygame.RESIZABLE)
+        self.dirty.resize(self.screen_width, self.screen_height)
+        self.paint_world(self.highlight)
+        self.refresh_screen = True
 
-            if self.rmb_tool.active():
-                # Repaint the entire screen until something better is implemented
-                self.paint_world()
-                self.refresh_screen = True
+    def quit(self):
+        """Close the window and exit"""
+        self.profiler.close()
+        pygame.display.quit()
+        sys.exit()
+
+    def toggle_profile(self):
+        """Show or hide the frame timings overlay"""
+        if self.profile_sprite:
+            self.overlay_sprites.remove(self.profile_sprite)
+            self.dirty.append(self.profile_sprite.rect)
+            self.profile_sprite = None
+        else:
+            self.profile_sprite = TextSprite((10, 50), self.profiler.text_lines(), self.profile_font,
+                                             fg=(0, 0, 0), bg=(255, 255, 255))
+            self.overlay_sprites.add(self.profile_sprite, layer=100)
+            self.dirty.append(self.profile_sprite.rect)
 
-            # Write some useful info on the top bar
-            self.fps_elapsed += self.clock.get_time()
-            if self.fps_elapsed >= self.fps_refresh:
-                self.fps_elapsed = 0
-                ii = self.lmb_tool.tile
-                if ii:
-                    layer = self.ordered_sprites.get_layer_of_sprite(ii)
-                    pygame.display.set_caption(
-                        "FPS: %i | Tile: (%s,%s) of type: %s, layer: %s | dxoff: %s dyoff: %s" %
-                        (self.clock.get_fps(), ii.x_world, ii.y_world, ii.type, layer, self.world.dxoff,
-                         self.world.dyoff))
-                else:
-                    pygame.display.set_caption(
-                        "FPS: %i | dxoff: %s dyoff: %s" %
-                        (self.clock.get_fps(), self.world.dxoff, self.world.dyoff))
-
-            # If land height has been altered, or the screen has been moved
-            # we need to refresh the entire screen
-            if self.refresh_screen:
+    @staticmethod
+    def coalesce_events(events):
+        """Collapse each run of mouse movements with the same buttons held into just the last of them,
+        with the movement of the whole run, so tools only do their work for the position which gets drawn"""
+        coalesced = []
+        for event in events:
+            if event.type == pygame.MOUSEMOTION and coalesced:
+                last = coalesced[-1]
+                if last.type == pygame.MOUSEMOTION and last.buttons == event.buttons:
+                    # Keep everything else the last event has, touch and window included
+                    attributes = dict(event.__dict__)
+                    attributes["rel"] = (last.rel[0] + event.rel[0], last.rel[1] + event.rel[1])
+                    event = pygame.event.Event(pygame.MOUSEMOTION, attributes)
+                    coalesced[-1] = event
+                    continue
+            coalesced.append(event)
+        return coalesced
+
+    def is_idle(self):
+        """Return True if nothing on the screen will change until there's some input"""
+        return not (self.benchmark or self.refresh_screen or self.dirty or self.scrolled or
+                    self.view_moved() or self.lmb_tool.has_aoe_changed())
+
+    def view_moved(self):
+        """Return True if the Move tool has moved the World offset since the screen was last drawn
+        Holding the button down without moving the mouse leaves nothing to do"""
+        return self.rmb_tool.active() and self.world.get_offset() != self.drawn_offset
+
+    def draw_frame(self):
+        """Bring the screen up to date, redrawing only the dirty parts of it unless a refresh is needed"""
+        # If land height has been altered, or the screen has been moved
+        # we need to refresh the entire screen
+        self.profiler.count("dirty_rects", len(self.dirty))
+        if self.refresh_screen or self.dirty.full:
+            with self.profiler.timed("draw"):
                 self.screen.fill((0, 0, 0))
                 self.ordered_sprites.draw(self.screen)
                 self.overlay_sprites.draw(self.screen)
+            with self.profiler.timed("display_update"):
                 pygame.display.update()
-                self.refresh_screen = False
-            else:
-                for r in self.dirty:
-                    self.screen.fill((0, 0, 0), r)
-
-                self.ordered_sprites.draw(self.screen)
-                self.overlay_sprites.draw(self.screen)
-                pygame.display.update(self.dirty)
+            self.refresh_screen = False
+            self.scrolled = False
+            self.drawn_offset = self.world.get_offset()
+        elif self.scrolled:
+            # Everything on the screen has moved
+            with self.profiler.timed("display_update"):
+                pygame.display.update()
+            self.scrolled = False
+        elif self.dirty:
+            with self.profiler.timed("draw"):
+                self.draw_regions(self.dirty.rects)
+            with self.profiler.timed("display_update"):
+                pygame.display.update(self.dirty.rects)
+        # Everything dirty has now been drawn
+        self.dirty.reset()
+
+    def scroll_view(self):
+        """Move what's on the screen to follow the World offset, and draw only the parts uncovered by the move
+        Returns False if the screen needs drawing from scratch instead"""
+        if self.drawn_offset is None:
+            return False
+        dx = self.world.dxoff - self.drawn_offset[0]
+        dy = self.world.dyoff - self.drawn_offset[1]
+        if abs(dx) >= self.screen_width or abs(dy) >= self.screen_height:
+            return False
+        if dx == 0 and dy == 0:
+            return True
+        self.drawn_offset = self.world.get_offset()
+        self.screen.scroll(-dx, -dy)
+        exposed = []
+        if dx > 0:
+            exposed.append(pygame.Rect(self.screen_width - dx, 0, dx, self.screen_height))
+        elif dx < 0:
+            exposed.append(pygame.Rect(0, 0, -dx, self.screen_height))
+        if dy > 0:
+            exposed.append(pygame.Rect(0, self.screen_height - dy, self.screen_width, dy))
+        elif dy < 0:
+            exposed.append(pygame.Rect(0, 0, self.screen_width, -dy))
+        # Overlays stay put, so the copy of them which was scrolled along needs drawing over too
+        for sprite in self.overlay_sprites:
+            exposed.append(sprite.rect.move(-dx, -dy))
+            exposed.append(pygame.Rect(sprite.rect))
+        self.draw_regions(exposed)
+        self.scrolled = True
+        return True
+
+    def draw_regions(self, rects):
+        """Redraw areas of the screen, blitting only the sprites which overlap them"""
+        for rect, sprites in zip(rects, self.ordered_sprites.sprites_in(rects)):
+            self.draw_region(rect, sprites)
+
+    def draw_region(self, rect, sprites):
+        """Redraw one area of the screen from a list of world sprites, in the order given, and the overlays"""
+        self.screen.set_clip(rect)
+        self.screen.fill((0, 0, 0))
+        dxoff, dyoff = self.world.get_offset()
+        for sprite in sprites:
+            self.screen.blit(sprite.image, (sprite.rect[0] - dxoff, sprite.rect[1] - dyoff))
+        self.overlay_sprites.draw(self.screen)
+        self.screen.set_clip(None)
 
     @staticmethod
     def array_to_string(array):
-        """Convert a heightfield array to a string"""
+        """Convert a heightfield array to a string, for debugging"""
         return "{}{}{}{}".format(*array)
 
+    def set_chunk_size(self, chunk_size):
+        """Draw the world as prerendered chunks of chunk_size tiles, or tile by tile if chunk_size is None"""
+        self.chunks = None
+        if chunk_size:
+            self.chunks = render.ChunkRenderer(self.world, self.make_tile_sprites, chunk_size)
+        self.paint_world(self.highlight, rebuild=True)
+
+    def update_history(self, tiles):
+        """Redraw the tiles changed by an undo or redo"""
+        if self.chunks:
+            self.update_world(tiles)
+            return
+        # Only tiles on screen, or behind one on screen whose cliffs depend on them, need their sprites updating
+        visible = self.ordered_sprites_dict
+        tiles = [(x, y) for x, y in tiles if (x, y) in visible or (x - 1, y) in visible or (x, y - 1) in visible]
+        if tiles:
+            self.update_world(tiles)
+
     def update_world(self, tiles, highlight=None):
         """Instead of completely regenerating the entire world, just update certain tiles"""
+        self.highlight = highlight
+        if self.chunks:
+            # Re-render the chunks holding the tiles, which may have changed size
+            dirty, rendered = self.chunks.invalidate(tiles)
+            self.dirty.extend(self.world.world_to_screen(r) for r in dirty)
+            for chunk in rendered:
+                self.ordered_sprites.set((chunk.cx, chunk.cy), chunk.cx + chunk.cy, [chunk])
+            return
         # Add all the items in tiles to the checked_nearby hash table
         nearby_tiles = []
         for t in tiles:
@@ -380,16 +693,13 @@ class DisplayMain(object):
             if highlight and (x, y) in highlight:
                 tile = highlight[(x, y)]
             else:
-                tile = self.world.array[x][y]
+                tile = self.world.get_tile(x, y)
             # Look the tile up in the group using the position, this will give us the tile and all its cliffs
             if (x, y) in self.ordered_sprites_dict:
                 tile_set = self.ordered_sprites_dict[(x, y)]
                 t = tile_set[0]
                 # Add old positions to dirty rect list
-                self.dirty.append(t.rect)
-
-                # Calculate layer
-                layer = self.get_layer(x, y)
+                self.dirty.append(self.world.world_to_screen(t.rect))
 
                 # Update the tile type
                 t.update_type()
@@ -398,118 +708,210 @@ class DisplayMain(object):
                 # Update cursor highlight for tile (if it has one)
                 if len(tile) >= 4:
                     t.change_highlight(tile[3])
-                self.dirty.append(t.update_xyz())
+                self.dirty.append(self.world.world_to_screen(t.update_xyz()))
+                profiler.count("tiles_repainted")
 
-                self.ordered_sprites.remove(tile_set)
-                # Recreate the cliffs
+                self.sprite_pool.extend(tile_set[1:])
+                # Recreate the cliffs, both where they were and where they are now need redrawing
+                self.dirty.extend(self.world.world_to_screen(c.rect) for c in tile_set[1:])
                 cliffs = self.make_cliffs(x, y)
+                self.dirty.extend(self.world.world_to_screen(c.rect) for c in cliffs)
                 cliffs.insert(0, t)
 
                 # Add the regenerated sprites back into the appropriate places
                 self.ordered_sprites_dict[(x, y)] = cliffs
-                self.ordered_sprites.add(cliffs, layer=layer)
+                self.ordered_sprites.set((x, y), self.get_layer(x, y), cliffs)
 
     @staticmethod
     def get_layer(x, y):
         """Return the layer a sprite should be based on some parameters"""
         return (x + y) * 10
 
-    def paint_world(self, highlight=None):
+    def paint_world(self, highlight=None, rebuild=False):
         """Paint the world as a series of sprites
-        Includes ground and other objects"""
+        Includes ground and other objects
+        Only tiles which have come into view get new sprites, unless rebuild is set"""
         # highlight defines tiles which should override the tiles stored in World
         # can be accessed in the same way as World
         self.refresh_screen = True
-        self.ordered_sprites.empty()  # This doesn't necessarily delete the sprites though?
-        self.ordered_sprites_dict = {}
-        # Top-left of view relative to world given by self.dxoff, self.dyoff
-        # Find the base-level tile at this position
-        top_left_tile_y, top_left_tile_x = self.screen_to_iso(self.world.dxoff, self.world.dyoff)
-        for x1 in range(int(self.screen_width / p + 1)):
-            for y1 in range(int(self.screen_height / p4)):
-                x = int(top_left_tile_x - x1 + math.ceil(y1 / 2.0))
-                y = int(top_left_tile_y + x1 + math.floor(y1 / 2.0))
-
-                # Tile must be within the bounds of the map
-                if (x >= 0 and y >= 0) and (x < self.world.WorldX and y < self.world.WorldY):
-                    # If an override is defined in highlight for this tile,
-                    # update based on that rather than on contents of World
-                    if highlight and (x, y) in highlight:
-                        tile = highlight[(x, y)]
-                    else:
-                        tile = self.world.array[x][y]
-                    layer = self.get_layer(x, y)
-                    # Add the main tile
-                    tile_type = self.array_to_string(tile[1])
-                    t = TileSprite(self.world, tile_type, x, y, tile[0], exclude=False)
-                    add_to_dict = [t]
-
-                    # Update cursor highlight for tile (if it has one)
-                    if len(tile) >= 4:
-                        t.change_highlight(tile[3])
-
-                    self.ordered_sprites.add(t, layer=layer)
-
-                    # Add vertical surfaces (cliffs) for this tile (if any)
-                    for t in self.make_cliffs(x, y):
-                        add_to_dict.append(t)
-                        self.ordered_sprites.add(t, layer=layer)
-                    self.ordered_sprites_dict[(x, y)] = add_to_dict
+        # Tiles highlighted before or after this need redoing
+        changed = set()
+        if highlight is not self.highlight:
+            changed.update(self.highlight or ())
+            changed.update(highlight or ())
+        self.highlight = highlight
+        if self.chunks:
+            self.ordered_sprites.empty()
+            self.ordered_sprites_dict = {}
+            for chunk in self.chunks.update_view(self.screen_width, self.screen_height):
+                self.ordered_sprites.set((chunk.cx, chunk.cy), chunk.cx + chunk.cy, [chunk])
+            return
+
+        visible = self.visible_tiles()
+        visible_set = set(visible)
+        if rebuild:
+            # Doesn't need to go through the sprites one by one
+            for tile_set in self.ordered_sprites_dict.values():
+                self.sprite_pool.extend(tile_set)
+            self.ordered_sprites.empty()
+            self.ordered_sprites_dict = {}
+        else:
+            for key in [k for k in self.ordered_sprites_dict if k not in visible_set or k in changed]:
+                self.sprite_pool.extend(self.ordered_sprites_dict.pop(key))
+                self.ordered_sprites.remove(key)
+
+        # Sprites are placed within the whole world image, so those still in view don't need moving
+        for x, y in visible:
+            if (x, y) not in self.ordered_sprites_dict:
+                tile_set = self.make_tile_sprites(x, y)
+                self.ordered_sprites.set((x, y), self.get_layer(x, y), tile_set)
+                self.ordered_sprites_dict[(x, y)] = tile_set
+
+    def render_view(self, rect=None, path=None):
+        """Draw a view of the World into a new surface, without the overlays, and save it as an image if path is given
+        rect is (x, y, width, height) within the whole world image, the whole world if None,
+        and mustn't be more than MAX_RENDER_PIXELS
+        Returns the surface; the screen is left as it was, to be drawn at the next frame"""
+        x, y, width, height = self.view_rect(self.world, rect)
+        offset = self.world.get_offset()
+        screen_size = self.screen_width, self.screen_height
+        # Paint the view through the same code as the screen, then go back to the screen's view
+        self.world.set_offset(x, y)
+        self.screen_width, self.screen_height = width, height
+        try:
+            self.paint_world(self.highlight)
+            surface = pygame.Surface((width, height)).convert()
+            surface.fill((0, 0, 0))
+            self.ordered_sprites.draw(surface)
+        finally:
+            self.world.set_offset(offset)
+            self.screen_width, self.screen_height = screen_size
+            self.paint_world(self.highlight)
+        if path:
+            pygame.image.save(surface, path)
+        return surface
+
+    @staticmethod
+    def view_rect(world, rect=None):
+        """Return the rect render_view draws for a rect given to it, the whole world image if None
+        Raises ValueError if it's more than MAX_RENDER_PIXELS, big worlds have to be rendered a rect at a time"""
+        if rect is None:
+            rect = world.get_image_rect()
+        if rect[2] * rect[3] > DisplayMain.MAX_RENDER_PIXELS:
+            raise ValueError("View of %i by %i pixels is too big to render, give a smaller rect" % tuple(rect[2:]))
+        return tuple(rect)
+
+    def visible_tiles(self):
+        """Return the tiles whose sprites, or their cliffs, can be seen on the screen at the World offset"""
+        world = self.world
+        left = world.dxoff
+        top = world.dyoff
+        right = left + self.screen_width
+        bottom = top + self.screen_height
+        # Tiles are drawn p wide at x = WorldWidth2 + u * p2 - p2 where u = y - x,
+        # and p high at y = d * p4 - height * ph where d = x + y, with their cliffs below them down to height 0
+        u0 = (left - world.WorldWidth2) // p2
+        u1 = (right - 1 - world.WorldWidth2) // p2 + 1
+        d0 = (top - p) // p4 + 1
+        d1 = (bottom + world.get_height_bound() * ph) // p4
+        d, u = numpy.meshgrid(numpy.arange(max(d0, 0), min(d1, world.WorldX + world.WorldY - 2) + 1),
+                              numpy.arange(u0, u1 + 1), indexing="ij")
+        # x + y and y - x are always both odd or both even
+        x = (d - u) // 2
+        y = (d + u) // 2
+        keep = ((d - u) % 2 == 0) & (x >= 0) & (x < world.WorldX) & (y >= 0) & (y < world.WorldY)
+        d, x, y = d[keep], x[keep], y[keep]
+        heights = world.store.gather(x, y)[0]
+        keep = d * p4 - heights.astype(numpy.int64) * ph < bottom
+        return list(zip(x[keep].tolist(), y[keep].tolist()))
+
+    def new_sprite(self, type_, x, y, z, exclude=False):
+        """Return a sprite for a tile or cliff, reusing one from the pool if there are any"""
+        if self.sprite_pool:
+            t = self.sprite_pool.pop()
+            t.reset(type_, x, y, z, exclude)
+            return t
+        profiler.count("sprites_created")
+        return TileSprite(self.world, type_, x, y, z, exclude)
+
+    def make_tile_sprites(self, x, y):
+        """Produce the sprite for a tile followed by the sprites of its cliffs"""
+        # If an override is defined in the highlight for this tile,
+        # use that rather than the contents of World
+        if self.highlight and (x, y) in self.highlight:
+            tile = self.highlight[(x, y)]
+            tile_type = heightfield.tile_type_of(tile[1])
+        else:
+            tile = self.world.get_tile(x, y)
+            tile_type = self.world.get_tile_type(x, y)
+        # Add the main tile
+        t = self.new_sprite(tile_type, x, y, tile[0], exclude=False)
+        profiler.count("tiles_repainted")
+
+        # Update cursor highlight for tile (if it has one)
+        if len(tile) >= 4:
+            t.change_highlight(tile[3])
+
+        # Add vertical surfaces (cliffs) for this tile (if any)
+        return [t] + self.make_cliffs(x, y)
 
     def make_cliffs(self, x, y):
         """Produce a set of cliff sprites to go with a particular tile"""
         result = []
+        height, vertices = self.world.get_tile(x, y)
         # a1/a2 are top and right vertices of tile in front/left of the one we're testing
         if x == self.world.WorldX - 1:
             a1 = 0
             a2 = 0
         else:
-            a1 = self.world.array[x + 1][y][1][3] + self.world.array[x + 1][y][0]
-            a2 = self.world.array[x + 1][y][1][2] + self.world.array[x + 1][y][0]
+            front_height, front_vertices = self.world.get_tile(x + 1, y)
+            a1 = front_vertices[3] + front_height
+            a2 = front_vertices[2] + front_height
 
         # b1/b2 are left and bottom vertices of tile we're testing
-        b1 = self.world.array[x][y][1][0] + self.world.array[x][y][0]
-        b2 = self.world.array[x][y][1][1] + self.world.array[x][y][0]
+        b1 = vertices[0] + height
+        b2 = vertices[1] + height
 
         while b1 > a1 or b2 > a2:
             if b1 > b2:
                 b1 -= 1
-                tile_type = "CL10"
+                tile_type = heightfield.CL10
             elif b1 == b2:
                 b1 -= 1
                 b2 -= 1
-                tile_type = "CL11"
+                tile_type = heightfield.CL11
             else:
                 b2 -= 1
-                tile_type = "CL01"
+                tile_type = heightfield.CL01
 
-            result.append(TileSprite(self.world, tile_type, x, y, b1, exclude=True))
+            result.append(self.new_sprite(tile_type, x, y, b1, exclude=True))
 
         # a1/a2 are top and right vertices of tile in front/right of the one we're testing
         if y == self.world.WorldY - 1:
             a1 = 0
             a2 = 0
         else:
-            a1 = self.world.array[x][y + 1][1][3] + self.world.array[x][y + 1][0]
-            a2 = self.world.array[x][y + 1][1][0] + self.world.array[x][y + 1][0]
+            front_height, front_vertices = self.world.get_tile(x, y + 1)
+            a1 = front_vertices[3] + front_height
+            a2 = front_vertices[0] + front_height
 
         # b1/b2 are left and bottom vertices of tile we're testing
-        b1 = self.world.array[x][y][1][2] + self.world.array[x][y][0]
-        b2 = self.world.array[x][y][1][1] + self.world.array[x][y][0]
+        b1 = vertices[2] + height
+        b2 = vertices[1] + height
 
         while b1 > a1 or b2 > a2:
             if b1 > b2:
                 b1 -= 1
-                tile_type = "CR10"
+                tile_type = heightfield.CR10
             elif b1 == b2:
                 b1 -= 1
                 b2 -= 1
-                tile_type = "CR11"
+                tile_type = heightfield.CR11
             else:
                 b2 -= 1
-                tile_type = "CR01"
+                tile_type = heightfield.CR01
 
-            result.append(TileSprite(self.world, tile_type, x, y, b1, exclude=True))
+            result.append(self.new_sprite(tile_type, x, y, b1, exclude=True))
 
         return result
 
@@ -529,11 +931,19 @@ class DisplayMain(object):
         return x, y
 
 
-if __name__ == "__main__":
-    import os
+def render_world(world, rect=None, path=None, chunk_size=None):
+    """Draw a view of a World without opening a window, see DisplayMain.render_view"""
+    rect = DisplayMain.view_rect(world, rect)
+    return DisplayMain(rect[2], rect[3], world, chunk_size, headless=True).render_view(rect, path)
 
+
+if __name__ == "__main__":
     os.environ["SDL_VIDEO_CENTERED"] = "1"
     WINDOW_WIDTH = 1024
     WINDOW_HEIGHT = 768
-    MainWindow = DisplayMain(WINDOW_WIDTH, WINDOW_HEIGHT, world.World())
+    # Run with --benchmark to draw frames as fast as possible, and --profile-log FILE to write frame timings to FILE
+    args = sys.argv[1:]
+    profile_log = args[args.index("--profile-log") + 1] if "--profile-log" in args[:-1] else None
+    MainWindow = DisplayMain(WINDOW_WIDTH, WINDOW_HEIGHT, world.World(), benchmark="--benchmark" in args,
+                             profile_log=profile_log)
     MainWindow.main_loop()
@@ -0,0 +1,336 @@
+import bisect
+
+import pygame
+
+import profiler
+
+# Pre-compute often used multiples
+p = 64
+p2 = int(p / 2)
+p4 = int(p / 4)
+
+# tile height difference
+ph = 8
+
+# Colour of the transparent parts of the tile images
+COLORKEY = (231, 255, 255)
+
+
+class DrawList(object):
+    """Sprites to be drawn, in buckets by their depth (the x + y diagonal for tiles)
+    Each entry is a list of sprites under a key, a tile and its cliffs under (x, y), which can be set
+    or removed in one go. Buckets are drawn from the lowest depth up, entries within a bucket in the order
+    they were first set. Sprite rects are within the whole world image, the World offset is applied as
+    they're drawn, so moving the view doesn't touch the sprites.
+    Entries are also indexed by the CELL_SIZE squares of the world image their sprites cover, so the sprites
+    in a small area can be found without going through all of them."""
+
+    CELL_SIZE = p
+
+    def __init__(self, world):
+        self.world = world
+        # key -> (depth, order set within its bucket, [sprite, ...])
+        self.entries = {}
+        self.next_order = 0
+        # (column, row) of a cell -> set of keys with a sprite overlapping it
+        self.cells = {}
+        # key -> cells its sprites overlap
+        self.key_cells = {}
+        # All the sprites in drawing order, and the (depth, order, index within the entry) each is sorted by,
+        # kept up to date as entries are set and removed
+        self.ordered = []
+        self.sort_keys = []
+
+    def __len__(self):
+        return len(self.ordered)
+
+    def __iter__(self):
+        return iter(self.ordered)
+
+    def cells_in(self, left, top, right, bottom):
+        """Return the cells overlapping an area of the world image, right and bottom exclusive"""
+        cs = self.CELL_SIZE
+        return [(i, j) for i in range(left // cs, (right - 1) // cs + 1)
+                for j in range(top // cs, (bottom - 1) // cs + 1)]
+
+    def set(self, key, depth, sprites):
+        """Set the sprites drawn for a key at a depth, replacing any it had before"""
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == depth:
+            order = entry[1]
+        else:
+            order = self.next_order
+            self.next_order += 1
+        self.remove(key)
+        self.entries[key] = (depth, order, sprites)
+        # (depth, order) sorts before (depth, order, 0), so this is where the entry's sprites go
+        i = bisect.bisect_left(self.sort_keys, (depth, order))
+        self.ordered[i:i] = sprites
+        self.sort_keys[i:i] = [(depth, order, n) for n in range(len(sprites))]
+        rects = [sprite.rect for sprite in sprites]
+        rects = [r for r in rects if r[2] > 0 and r[3] > 0]
+        if rects:
+            cells = self.cells_in(min(r[0] for r in rects), min(r[1] for r in rects),
+                                  max(r[0] + r[2] for r in rects), max(r[1] + r[3] for r in rects))
+            for cell in cells:
+                self.cells.setdefault(cell, set()).add(key)
+            self.key_cells[key] = cells
+
+    def get(self, key):
+        """Return the sprites drawn for a key, or None"""
+        entry = self.entries.get(key)
+        return None if entry is None else entry[2]
+
+    def remove(self, key):
+        """Stop drawing the sprites for a key"""
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            depth, order, sprites = entry
+            i = bisect.bisect_left(self.sort_keys, (depth, order))
+            del self.ordered[i:i + len(sprites)]
+            del self.sort_keys[i:i + len(sprites)]
+            for cell in self.key_cells.pop(key, ()):
+                keys = self.cells[cell]
+                keys.discard(key)
+                if not keys:
+                    del self.cells[cell]
+
+    def empty(self):
+        """Remove all the sprites"""
+        self.entries = {}
+        self.cells = {}
+        self.key_cells = {}
+        self.ordered = []
+        self.sort_keys = []
+
+    def sprites(self):
+        """Return all the sprites in drawing order"""
+        return self.ordered
+
+    def draw(self, surface):
+        """Draw all the sprites, returns the screen rects drawn to"""
+        dxoff, dyoff = self.world.get_offset()
+        blit = surface.blit
+        return [blit(sprite.image, (sprite.rect[0] - dxoff, sprite.rect[1] - dyoff)) for sprite in self.sprites()]
+
+    def sprites_in(self, rects):
+        """Return the sprites overlapping each of a list of screen rects, in drawing order"""
+        dxoff, dyoff = self.world.get_offset()
+        result = []
+        for rect in rects:
+            rect = pygame.Rect(rect).move(dxoff, dyoff)
+            if not rect.width or not rect.height:
+                result.append([])
+                continue
+            keys = set()
+            for cell in self.cells_in(rect.left, rect.top, rect.right, rect.bottom):
+                keys.update(self.cells.get(cell, ()))
+            entries = sorted((self.entries[key] for key in keys), key=lambda e: e[:2])
+            result.append([sprite for depth, order, sprites in entries for sprite in sprites
+                           if rect.colliderect(sprite.rect)])
+        return result
+
+
+class DirtyRegion(object):
+    """The rects of the screen which need redrawing this frame
+    Overlapping and touching rects are merged as they're added, and once they cover more than
+    full_threshold of the screen it is all redrawn instead"""
+
+    FULL_THRESHOLD = 0.5
+
+    def __init__(self, width, height, full_threshold=FULL_THRESHOLD):
+        self.screen_rect = pygame.Rect(0, 0, width, height)
+        self.full_threshold = full_threshold
+        self.rects = []
+        self.full = False
+
+    def __len__(self):
+        return len(self.rects)
+
+    def __iter__(self):
+        return iter(self.rects)
+
+    def resize(self, width, height):
+        """Change the size of the screen, everything needs redrawing after that"""
+        self.screen_rect = pygame.Rect(0, 0, width, height)
+        self.set_full()
+
+    def set_full(self):
+        """Mark the whole screen as dirty"""
+        self.full = True
+        self.rects = [self.screen_rect.copy()]
+
+    def append(self, rect):
+        """Add a rect to the region"""
+        if self.full:
+            return
+        rect = self.screen_rect.clip(pygame.Rect(rect))
+        if not rect.width or not rect.height:
+            return
+        # Keep merging until the rect doesn't overlap or touch any of the others
+        merged = True
+        while merged:
+            merged = False
+            grown = rect.inflate(2, 2)
+            for i, other in enumerate(self.rects):
+                if grown.colliderect(other):
+                    rect.union_ip(self.rects.pop(i))
+                    merged = True
+                    break
+        self.rects.append(rect)
+        if sum(r.width * r.height for r in self.rects) > \
+                self.full_threshold * self.screen_rect.width * self.screen_rect.height:
+            self.set_full()
+
+    def extend(self, rects):
+        """Add several rects to the region"""
+        for rect in rects:
+            self.append(rect)
+
+    def reset(self):
+        """Empty the region, once it's been drawn"""
+        self.rects = []
+        self.full = False
+
+
+class ChunkSprite(pygame.sprite.Sprite):
+    """A square block of tiles and their cliffs composited into one image"""
+    # A chunk covers many tiles, so it can't be picked as a tile
+    exclude = True
+
+    def __init__(self, cx, cy):
+        super().__init__()
+        self.cx = cx
+        self.cy = cy
+        self.image = None
+        # Position of the image within the whole world image, as for TileSprite
+        self.x_pos = 0
+        self.y_pos = 0
+        self.rect = pygame.Rect(0, 0, 0, 0)
+
+    def render(self, sprites):
+        """Draw a list of tile and cliff sprites into this chunk's image, in the order given"""
+        left = min(s.x_pos for s in sprites)
+        top = min(s.y_pos for s in sprites)
+        right = max(s.x_pos for s in sprites) + p
+        bottom = max(s.y_pos for s in sprites) + p
+        image = pygame.Surface((right - left, bottom - top)).convert()
+        profiler.count("surfaces_allocated")
+        image.fill(COLORKEY)
+        for s in sprites:
+            image.blit(s.image, (s.x_pos - left, s.y_pos - top))
+        image.set_colorkey(COLORKEY, pygame.RLEACCEL)
+        self.image = image
+        self.x_pos = left
+        self.y_pos = top
+        self.rect = pygame.Rect(left, top, right - left, bottom - top)
+
+
+class ChunkRenderer(object):
+    """Draws the World as prerendered chunks of tiles, rather than as a sprite for every tile and cliff
+    make_sprites(x, y) returns the sprites for a tile, the tile itself followed by its cliffs
+    Chunks are drawn in order of cx + cy, which keeps the painter's order of the tiles within them"""
+
+    CHUNK_SIZE = 8
+    # Chunks kept rendered, including ones which have gone out of view, as a multiple of the number in view
+    # Each is around 1MB at the default size, so the cache follows the size of the screen rather than the World
+    CACHE_VIEWS = 3
+
+    def __init__(self, world, make_sprites, chunk_size=CHUNK_SIZE, cache_views=CACHE_VIEWS):
+        self.world = world
+        self.make_sprites = make_sprites
+        self.chunk_size = chunk_size
+        self.cache_views = cache_views
+        # (cx, cy) -> ChunkSprite
+        self.chunks = {}
+        # Chunks in the current view, in drawing order
+        self.visible = []
+
+    def render_chunk(self, cx, cy):
+        """Render (or re-render) a chunk, returns its ChunkSprite"""
+        cs = self.chunk_size
+        x0 = cx * cs
+        y0 = cy * cs
+        x1 = min(x0 + cs, self.world.WorldX)
+        y1 = min(y0 + cs, self.world.WorldY)
+        sprites = []
+        # Walk the tiles back to front by their x + y diagonal
+        for d in range(x0 + y0, x1 + y1 - 1):
+            for x in range(max(x0, d - y1 + 1), min(x1, d - y0 + 1)):
+                sprites.extend(self.make_sprites(x, d - x))
+        chunk = self.chunks.get((cx, cy))
+        if chunk is None:
+            chunk = ChunkSprite(cx, cy)
+            profiler.count("sprites_created")
+            self.chunks[(cx, cy)] = chunk
+        chunk.render(sprites)
+        return chunk
+
+    def max_cached(self):
+        """Return the number of chunks kept rendered for the current view"""
+        return self.cache_views * len(self.visible)
+
+    def visible_chunks(self, width, height):
+        """Return the (cx, cy) of the chunks which can be seen in a width by height view at the World offset"""
+        world = self.world
+        cs = self.chunk_size
+        left = world.dxoff
+        top = world.dyoff
+        # Tiles are drawn p wide at x = WorldWidth2 + u * p2 - p2 where u = y - x,
+        # and p high at y = d * p4 - height * ph where d = x + y
+        u0 = (left - world.WorldWidth2) // p2 - 1
+        u1 = (left + width - world.WorldWidth2) // p2 + 1
+        d0 = (top - p) // p4
+        d1 = (top + height + world.get_height_bound() * ph) // p4 + 1
+        cx0 = max((d0 - u1) // 2, 0) // cs
+        cx1 = min((d1 - u0) // 2, world.WorldX - 1) // cs
+        cy0 = max((d0 + u0) // 2, 0) // cs
+        cy1 = min((d1 + u1) // 2, world.WorldY - 1) // cs
+        visible = []
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                # Range of d and u covered by the tiles of this chunk
+                if (cx + cy) * cs <= d1 and (cx + cy + 2) * cs - 2 >= d0 and \
+                        (cy - cx - 1) * cs + 1 <= u1 and (cy - cx + 1) * cs - 1 >= u0:
+                    visible.append((cx, cy))
+        visible.sort(key=lambda c: c[0] + c[1])
+        return visible
+
+    def update_view(self, width, height):
+        """Render any chunks which have come into view, returns the visible ChunkSprites in drawing order"""
+        self.visible = self.visible_chunks(width, height)
+        for key in self.visible:
+            if key not in self.chunks:
+                self.render_chunk(*key)
+        # Forget chunks out of view once there are too many
+        max_cached = self.max_cached()
+        if len(self.chunks) > max_cached:
+            visible = set(self.visible)
+            for key in [k for k in self.chunks if k not in visible][:len(self.chunks) - max_cached]:
+                del self.chunks[key]
+        return [self.chunks[key] for key in self.visible]
+
+    def invalidate(self, tiles):
+        """Re-render the chunks containing a list of tiles, and the tiles behind them whose cliffs may change
+        Returns the rects within the whole world image which need redrawing, and the ChunkSprites re-rendered"""
+        cs = self.chunk_size
+        keys = set()
+        for x, y in tiles:
+            for xx, yy in ((x, y), (x - 1, y), (x, y - 1)):
+                if 0 <= xx < self.world.WorldX and 0 <= yy < self.world.WorldY:
+                    keys.add((xx // cs, yy // cs))
+        visible = set(self.visible)
+        dirty = []
+        rendered = []
+        for key in keys:
+            if key not in self.chunks:
+                continue
+            if key not in visible:
+                # Rendered again if it comes back into view
+                del self.chunks[key]
+                continue
+            old_rect = self.chunks[key].rect
+            chunk = self.render_chunk(*key)
+            dirty.append(old_rect.union(chunk.rect))
+            rendered.append(chunk)
+        return dirty, rendered
@@ -0,0 +1,147 @@
+import numpy
+
+import heightfield
+from world import World
+
+# Neighbours of a tile and the vertices they share with it, the same as Terrain.soften has always used
+# (dx, dy, [(vertex of tile, vertex of neighbour), ...])
+NEIGHBOURS = [
+    (1, -1, [(0, 2)]),
+    (1, 1, [(1, 3)]),
+    (-1, 1, [(2, 0)]),
+    (-1, -1, [(3, 1)]),
+    (0, -1, [(3, 2), (0, 1)]),
+    (1, 0, [(0, 3), (1, 2)]),
+    (0, 1, [(1, 0), (2, 3)]),
+    (-1, 0, [(2, 1), (3, 0)]),
+]
+
+# Distance between two vertices going round the tile, RING_DISTANCE[a][b]
+RING_DISTANCE = numpy.array([[min(abs(a - b), 4 - abs(a - b)) for b in range(4)] for a in range(4)])
+
+# Starting margin around the softened tiles, doubled whenever the softening reaches the edge of it
+INITIAL_MARGIN = 16
+
+# Stands in for "no limit" on a vertex
+UNBOUNDED = 1 << 20
+
+
+class SoftenResult(object):
+    """Tiles changed by a soften, as a mask within a rect of the World"""
+
+    def __init__(self, x0, y0, mask):
+        self.x0 = x0
+        self.y0 = y0
+        self.mask = mask
+
+    def __len__(self):
+        return int(self.mask.sum())
+
+    def rect(self):
+        """Return (x0, y0, x1, y1) of the area the mask covers"""
+        return self.x0, self.y0, self.x0 + self.mask.shape[0], self.y0 + self.mask.shape[1]
+
+    def tiles(self):
+        """Return the changed tiles as a list of (x, y)"""
+        xs, ys = numpy.nonzero(self.mask)
+        return list(zip((xs + self.x0).tolist(), (ys + self.y0).tolist()))
+
+
+def shifted(dx, dy, size_x, size_y):
+    """Return (source, destination) slices moving an array of size_x by size_y by dx, dy"""
+    src = (slice(max(-dx, 0), size_x - max(dx, 0)), slice(max(-dy, 0), size_y - max(dy, 0)))
+    dst = (slice(max(dx, 0), size_x - max(-dx, 0)), slice(max(dy, 0), size_y - max(-dy, 0)))
+    return src, dst
+
+
+def run_waves(corners, frontier, up, budget):
+    """Soften within a window of absolute vertex heights, corners has shape (w, h, 4) and is updated in place
+    Each wave moves every vertex shared with the frontier tiles up (or down) to meet them, keeping to the
+    vertex rules, then the changed tiles become the next frontier. Tiles which have been in a frontier
+    aren't changed again. Returns the mask of changed tiles."""
+    size_x, size_y = frontier.shape
+    done = numpy.zeros_like(frontier)
+    changed_any = numpy.zeros_like(frontier)
+    work = 0
+    combine = numpy.maximum if up else numpy.minimum
+    fill = -UNBOUNDED if up else UNBOUNDED
+    while frontier.any():
+        done |= frontier
+        # Only the area around the frontier can change this wave
+        xs, ys = numpy.nonzero(frontier)
+        x0 = max(xs.min() - 1, 0)
+        x1 = min(xs.max() + 2, size_x)
+        y0 = max(ys.min() - 1, 0)
+        y1 = min(ys.max() + 2, size_y)
+        area = (slice(x0, x1), slice(y0, y1))
+        a_corners = corners[area]
+        a_frontier = frontier[area]
+
+        # Height each vertex has to be moved to, to meet the frontier tiles next to it
+        bound = numpy.full(a_corners.shape, fill, dtype=a_corners.dtype)
+        for dx, dy, pairs in NEIGHBOURS:
+            src, dst = shifted(dx, dy, x1 - x0, y1 - y0)
+            source_frontier = a_frontier[src]
+            for a, b in pairs:
+                values = numpy.where(source_frontier, a_corners[src][..., a], fill)
+                bound[dst][..., b] = combine(bound[dst][..., b], values)
+
+        # Moving one vertex drags the others along with it, no more than 1 level apart going round the tile
+        if up:
+            target = (bound[..., :, None] - RING_DISTANCE[None, None]).max(axis=2)
+        else:
+            target = (bound[..., :, None] + RING_DISTANCE[None, None]).min(axis=2)
+        moved = combine(a_corners, target)
+        moved[done[area]] = a_corners[done[area]]
+        a_changed = (moved != a_corners).any(axis=-1)
+        corners[area] = moved
+
+        frontier = numpy.zeros_like(frontier)
+        frontier[area] = a_changed
+        changed_any |= frontier
+        work += int(a_changed.sum())
+        if budget is not None and work >= budget:
+            break
+    return changed_any
+
+
+def soften_region(tiles, up=True, radius=None, budget=None):
+    """Soften the tiles around a set of tiles, raising (or lowering) their neighbours to make a smooth slope
+    radius limits how far from the tiles the softening can spread, budget limits the number of tile changes
+    Returns a SoftenResult for the tiles which were changed"""
+    tiles = [t for t in tiles if World.in_bounds(*t)]
+    if not tiles:
+        return SoftenResult(0, 0, numpy.zeros((0, 0), dtype=bool))
+    xs = numpy.array([t[0] for t in tiles])
+    ys = numpy.array([t[1] for t in tiles])
+    margin = INITIAL_MARGIN if radius is None else radius
+    while True:
+        x0 = max(int(xs.min()) - margin, 0)
+        y0 = max(int(ys.min()) - margin, 0)
+        x1 = min(int(xs.max()) + margin + 1, World.WorldX)
+        y1 = min(int(ys.max()) + margin + 1, World.WorldY)
+        heights, packed = World.store.read_region(x0, y0, x1, y1)
+        corners = heights.astype(numpy.int32)[..., None] + heightfield.unpack_vertex_array(packed)
+        frontier = numpy.zeros(heights.shape, dtype=bool)
+        frontier[xs - x0, ys - y0] = True
+        changed = run_waves(corners, frontier, up, budget)
+        if radius is not None:
+            break
+        # If the softening reached the edge of the window (and that isn't the edge of the World)
+        # it may have needed to carry on beyond it, so start over with a bigger window
+        spilled = ((x0 > 0 and changed[0].any()) or (x1 < World.WorldX and changed[-1].any()) or
+                   (y0 > 0 and changed[:, 0].any()) or (y1 < World.WorldY and changed[:, -1].any()))
+        if not spilled:
+            break
+        margin *= 2
+
+    cx, cy = numpy.nonzero(changed)
+    if len(cx):
+        tile_corners = corners[cx, cy]
+        tile_heights = tile_corners.min(axis=-1)
+        World.set_tiles(cx + x0, cy + y0, tile_heights.astype(numpy.int16),
+                        heightfield.pack_vertex_array(tile_corners - tile_heights[:, None]))
+        mx0, my0 = cx.min(), cy.min()
+        mask = changed[mx0:cx.max() + 1, my0:cy.max() + 1]
+        return SoftenResult(int(mx0 + x0), int(my0 + y0), mask)
+    return SoftenResult(x0, y0, numpy.zeros((0, 0), dtype=bool))
@@ -0,0 +1,88 @@
+import sys
+
+import numpy
+
+import heightfield
+
+
+def value_noise(size_x, size_y, scale, random_state):
+    """Return a (size_x, size_y) float32 array of smoothly interpolated random values in 0..1
+    Random values are placed on a grid every scale points and interpolated between"""
+    grid = random_state.rand(size_x // scale + 2, size_y // scale + 2).astype(numpy.float32)
+
+    def axis(size):
+        t = numpy.arange(size, dtype=numpy.float32) / scale
+        i = t.astype(numpy.int32)
+        f = t - i
+        # Smoothstep so that the grid doesn't show through as creases
+        return i, f * f * (3 - 2 * f)
+
+    ix, fx = axis(size_x)
+    iy, fy = axis(size_y)
+    fx = fx[:, None]
+    fy = fy[None, :]
+    top = grid[ix][:, iy] * (1 - fy) + grid[ix][:, iy + 1] * fy
+    bottom = grid[ix + 1][:, iy] * (1 - fy) + grid[ix + 1][:, iy + 1] * fy
+    return top * (1 - fx) + bottom * fx
+
+
+def fractal_noise(size_x, size_y, scale, octaves, persistence, random_state):
+    """Sum several octaves of value noise, normalised to 0..1"""
+    total = numpy.zeros((size_x, size_y), dtype=numpy.float32)
+    amplitude = 1.0
+    amplitudes = 0.0
+    for _ in range(octaves):
+        total += value_noise(size_x, size_y, max(int(scale), 1), random_state) * amplitude
+        amplitudes += amplitude
+        amplitude *= persistence
+        scale /= 2.0
+    return total / amplitudes
+
+
+def limit_slope(corners, axis):
+    """Lower corners along one axis until neighbouring corners are no more than 1 level apart
+    This is min(corners[q] + |p - q|) over q, worked out as a forward and backward running minimum"""
+    shape = [1] * corners.ndim
+    shape[axis] = corners.shape[axis]
+    index = numpy.arange(corners.shape[axis], dtype=corners.dtype).reshape(shape)
+    forward = numpy.minimum.accumulate(corners - index, axis=axis) + index
+    backward = numpy.flip(numpy.minimum.accumulate(numpy.flip(corners + index, axis), axis=axis), axis) - index
+    return numpy.minimum(forward, backward)
+
+
+def corners_to_tiles(corners):
+    """Split a (size_x + 1, size_y + 1) lattice of vertex heights into tile heights and packed vertices
+    The top vertex of tile (x, y) is corner (x, y), left (x + 1, y), bottom (x + 1, y + 1) and right (x, y + 1)"""
+    vertices = numpy.stack([corners[1:, :-1], corners[1:, 1:], corners[:-1, 1:], corners[:-1, :-1]], axis=-1)
+    heights = vertices.min(axis=-1)
+    vertices -= heights[..., None]
+    return heights.astype(numpy.int16), heightfield.pack_vertex_array(vertices)
+
+
+def generate(size_x, size_y, seed=None, max_height=16, scale=64, octaves=4, persistence=0.5, sea_level=0.3,
+             store=None):
+    """Generate noise-based terrain of size_x by size_y tiles, written into store (a new DenseStore by default)
+    Noise below sea_level becomes flat ground at height 0, the rest is spread over 0..max_height
+    Neighbouring vertices are kept within 1 level, so every tile is one of the valid vertex patterns"""
+    random_state = numpy.random.RandomState(seed)
+    noise = fractal_noise(size_x + 1, size_y + 1, scale, octaves, persistence, random_state)
+    noise = (noise - sea_level) / (1.0 - sea_level)
+    corners = numpy.clip(noise * (max_height + 1), 0, max_height).astype(numpy.int32)
+    # Slope limiting only ever lowers corners, so sea level stays flat
+    corners = limit_slope(limit_slope(corners, 0), 1)
+    heights, vertices = corners_to_tiles(corners)
+
+    if store is None:
+        store = heightfield.DenseStore(size_x, size_y)
+    store.write_region(0, 0, heights, vertices)
+    return store
+
+
+if __name__ == "__main__":
+    # Generate a map and save it: python terrain_gen.py size [filename] [seed]
+    import world_file
+
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    filename = sys.argv[2] if len(sys.argv) > 2 else "generated.ptw"
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    world_file.save(filename, generate(size, size, seed), {})
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Rendering tests run without a window
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+
+
+@pytest.fixture
+def display(monkeypatch):
+    """A headless DisplayMain on the demo map, textures.png is loaded from the working directory"""
+    monkeypatch.chdir(ROOT)
+    import pytile
+    import world
+    world.World.load_tile_map(world.World.make_array())
+    world.World.set_offset(0, 0)
+    return pytile.DisplayMain(800, 600, world.World(), headless=True)
@@ -0,0 +1,18 @@
+import copy
+import os
+
+import benchmark
+
+
+def test_benchmark_runs_and_compares(monkeypatch):
+    monkeypatch.chdir(os.path.dirname(os.path.abspath(benchmark.__file__)))
+    report = benchmark.run(["demo"], benchmark.SCENARIOS, frames=3)
+    assert [r["scenario"] for r in report["results"]] == benchmark.SCENARIOS
+    for result in report["results"]:
+        assert result["frames"] == 3
+        assert set(result["phase_ms"]) == set(benchmark.profiler.FrameProfiler.PHASES)
+        assert set(result["counts"]) == set(benchmark.COUNTERS)
+        assert result["python_alloc"]["peak_kb"] >= 0 and result["python_alloc"]["blocks"] >= 0
+    rows = benchmark.compare(report, copy.deepcopy(report))
+    assert len(rows) == len(benchmark.SCENARIOS) * len(benchmark.PERCENTILES)
+    assert not any(row[-1] for row in rows)
@@ -0,0 +1,57 @@
+import numpy
+import pytest
+
+import heightfield
+import world
+
+
+def scalar_correct(heights, vertices, fixed):
+    """Run TGrid.correct_vertices on every tile of a grid"""
+    new_heights = numpy.zeros_like(heights)
+    new_vertices = numpy.zeros_like(vertices)
+    for x in range(heights.shape[0]):
+        for y in range(heights.shape[1]):
+            tgrid = world.TGrid(int(heights[x, y]), [int(v) for v in vertices[x, y]])
+            tgrid.correct_vertices(int(fixed[x, y]))
+            new_heights[x, y] = tgrid.height
+            new_vertices[x, y] = tgrid.array
+    return new_heights, new_vertices
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_tgrid_on_random_grids(seed):
+    rng = numpy.random.RandomState(seed)
+    shape = (rng.randint(1, 30), rng.randint(1, 30))
+    heights = rng.randint(0, 12, size=shape)
+    # Out of range vertices too, which move the tile itself
+    vertices = rng.randint(-3, 6, size=shape + (4,))
+    # Edge rows and columns get the extremes
+    heights[0, :] = 0
+    heights[:, -1] = 11
+    vertices[-1, :] = 5
+    vertices[:, 0] = -3
+    fixed = rng.randint(0, 4, size=shape)
+
+    expected_heights, expected_vertices = scalar_correct(heights, vertices, fixed)
+    new_heights, new_vertices = heightfield.correct_vertices(heights, vertices, fixed)
+    assert (new_heights == expected_heights).all()
+    assert (new_vertices == expected_vertices).all()
+
+    # One fixed vertex for the whole grid
+    for v in range(4):
+        expected_heights, expected_vertices = scalar_correct(heights, vertices, numpy.full(shape, v))
+        new_heights, new_vertices = heightfield.correct_vertices(heights, vertices, v)
+        assert (new_heights == expected_heights).all()
+        assert (new_vertices == expected_vertices).all()
+
+
+def test_every_vertex_pattern():
+    # Every pattern of vertices from -1 to 3, one row of the grid for each fixed vertex
+    patterns = numpy.array(numpy.meshgrid(*[range(-1, 4)] * 4, indexing="ij")).reshape(4, -1).T
+    vertices = numpy.repeat(patterns[None], 4, axis=0)
+    heights = numpy.ones(vertices.shape[:2], dtype=int)
+    fixed = numpy.repeat(numpy.arange(4)[:, None], len(patterns), axis=1)
+    expected_heights, expected_vertices = scalar_correct(heights, vertices, fixed)
+    new_heights, new_vertices = heightfield.correct_vertices(heights, vertices, fixed)
+    assert (new_heights == expected_heights).all()
+    assert (new_vertices == expected_vertices).all()
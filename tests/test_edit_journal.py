@@ -0,0 +1,84 @@
+import numpy
+
+import world
+
+
+def heights_of(W):
+    xs, ys = numpy.indices((W.WorldX, W.WorldY))
+    return numpy.array(W.store.gather(xs.ravel(), ys.ravel())[0])
+
+
+def raise_tiles(W, tiles, times=1):
+    for _ in range(times):
+        W.raise_region(tiles, 1)
+
+
+def test_undo_redo_round_trip():
+    W = world.World
+    W.new_flat(32, 32)
+    before = heights_of(W)
+    W.begin_edit()
+    raise_tiles(W, [(3, 4), (3, 5), (4, 4)], 3)
+    W.end_edit()
+    after = heights_of(W)
+    assert sorted(W.undo()) == [(3, 4), (3, 5), (4, 4)]
+    assert (heights_of(W) == before).all()
+    W.redo()
+    assert (heights_of(W) == after).all()
+
+
+def test_long_edit_records_each_tile_once():
+    W = world.World
+    W.new_flat(32, 32)
+    W.begin_edit()
+    for _ in range(50):
+        raise_tiles(W, [(1, 1), (1, 2)])
+    assert len(W.journal.recorded) == 2
+    W.end_edit()
+    W.undo()
+    assert (heights_of(W) == 0).all()
+
+
+def test_edit_counts_against_memory_cap():
+    W = world.World
+    W.new_flat(64, 64)
+    W.begin_edit()
+    raise_tiles(W, [(0, 0)])
+    W.end_edit()
+    assert len(W.journal.undo_entries) == 1
+    # An edit in progress pushes out old entries
+    W.journal.memory_cap = 100 * W.journal.TILE_NBYTES + 5
+    W.begin_edit()
+    raise_tiles(W, [(x, y) for x in range(1, 11) for y in range(1, 11)])
+    assert len(W.journal.undo_entries) == 0
+    assert W.journal.nbytes + W.journal.pending_nbytes() <= W.journal.memory_cap
+    W.end_edit()
+    assert len(W.journal.undo_entries) == 1
+
+
+def test_edit_bigger_than_memory_cap_clears_history():
+    W = world.World
+    W.new_flat(64, 64)
+    W.begin_edit()
+    raise_tiles(W, [(0, 0)])
+    W.end_edit()
+    W.journal.memory_cap = 10 * W.journal.TILE_NBYTES
+    W.begin_edit()
+    raise_tiles(W, [(x, y) for x in range(1, 11) for y in range(1, 11)])
+    assert not W.journal.recorded
+    W.end_edit()
+    assert W.undo() == []
+    assert W.journal.nbytes == 0
+
+
+def test_redo_raises_height_bound():
+    W = world.World
+    W.new_flat(16, 16)
+    W.begin_edit()
+    raise_tiles(W, [(2, 2)], 5)
+    W.end_edit()
+    W.undo()
+    W.height_bound = None
+    assert W.get_height_bound() == 0
+    W.redo()
+    assert W.get_height_bound() == 5
@@ -0,0 +1,72 @@
+import pygame
+
+import pytile
+import tools
+
+
+def rmb_down(pos):
+    return pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=pos, button=3)
+
+
+def rmb_drag(pos, rel):
+    return pygame.event.Event(pygame.MOUSEMOTION, pos=pos, rel=rel, buttons=(0, 0, 1))
+
+
+def test_holding_rmb_still_is_idle(display):
+    display.run_frame([])
+    assert display.is_idle()
+    display.run_frame([rmb_down((400, 300))])
+    # Button held down without moving
+    assert display.is_idle()
+    painted = []
+    display.paint_world = lambda *args, **kwargs: painted.append(args)
+    display.run_frame([])
+    assert not painted
+
+
+def test_dragging_is_busy_until_drawn(display):
+    display.run_frame([rmb_down((400, 300))])
+    display.run_frame([rmb_drag((390, 295), (-10, -5))])
+    assert display.drawn_offset == display.world.get_offset()
+    assert display.is_idle()
+    # Moved since the screen was drawn
+    display.rmb_tool.mouse_move((380, 290), display.ordered_sprites)
+    assert not display.is_idle()
+    display.run_frame([])
+    assert display.is_idle()
+
+
+def test_coalesce_keeps_the_last_event():
+    events = [pygame.event.Event(pygame.MOUSEMOTION, pos=(10, 10), rel=(1, 2), buttons=(0, 0, 0), touch=False,
+                                 window=None),
+              pygame.event.Event(pygame.MOUSEMOTION, pos=(13, 15), rel=(3, 5), buttons=(0, 0, 0), touch=True,
+                                 window="w"),
+              pygame.event.Event(pygame.MOUSEMOTION, pos=(20, 20), rel=(7, 5), buttons=(1, 0, 0))]
+    coalesced = pytile.DisplayMain.coalesce_events(events)
+    assert len(coalesced) == 2
+    assert coalesced[0].pos == (13, 15)
+    assert coalesced[0].rel == (4, 7)
+    assert coalesced[0].touch is True
+    assert coalesced[0].window == "w"
+    assert coalesced[1] is events[2]
+
+
+def test_scrolled_frame_matches_repaint(display):
+    # No Terrain highlight following the cursor, a change to it repaints the whole screen instead of scrolling
+    display.lmb_tool = tools.Tool()
+    scrolls = []
+    scroll_view = display.scroll_view
+    display.scroll_view = lambda: scrolls.append(scroll_view()) or scrolls[-1]
+    display.paint_world()
+    display.run_frame([])
+    display.run_frame([rmb_down((400, 300))])
+    pos = (400, 300)
+    for rel in [(-10, -5), (37, 0), (0, 23), (-64, 40), (3, -1)]:
+        pos = (pos[0] + rel[0], pos[1] + rel[1])
+        display.run_frame([rmb_drag(pos, rel)])
+        assert scrolls[-1] is True
+        scrolled = pygame.image.tostring(display.screen, "RGB")
+        # The same offset drawn from scratch
+        display.refresh_screen = True
+        display.draw_frame()
+        assert pygame.image.tostring(display.screen, "RGB") == scrolled, rel
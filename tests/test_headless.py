@@ -0,0 +1,40 @@
+import os
+
+import pygame
+import pytest
+
+import pytile
+import world
+
+
+def test_headless_switches_a_running_display_to_dummy(monkeypatch):
+    monkeypatch.chdir(os.path.dirname(os.path.abspath(pytile.__file__)))
+    pygame.display.quit()
+    monkeypatch.setenv("SDL_VIDEODRIVER", "offscreen")
+    try:
+        pygame.display.init()
+    except pygame.error:
+        pytest.skip("no offscreen video driver")
+    assert pygame.display.get_driver() == "offscreen"
+    world.World.load_tile_map(world.World.make_array())
+    pytile.DisplayMain(200, 100, world.World(), headless=True)
+    assert pygame.display.get_driver() == "dummy"
+
+
+def test_headless_resize_stays_offscreen(display):
+    display.paint_world()
+    display.draw_frame()
+    display.run_frame([pygame.event.Event(pygame.VIDEORESIZE, w=400, h=300, size=(400, 300))])
+    assert display.screen.get_size() == (400, 300)
+    assert display.screen is not pygame.display.get_surface()
+    assert pygame.display.get_surface().get_size() == (1, 1)
+
+
+def test_render_view_of_a_huge_world_needs_a_rect(display):
+    world.World.new_flat(4096, 4096)
+    world.World()
+    with pytest.raises(ValueError):
+        display.render_view()
+    with pytest.raises(ValueError):
+        pytile.render_world(display.world)
+    assert display.render_view((0, 0, 320, 200)).get_size() == (320, 200)
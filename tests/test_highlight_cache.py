@@ -0,0 +1,31 @@
+import heightfield
+import pytile
+
+
+def test_hits_misses_and_eviction(display):
+    # Loads the tile images
+    display.paint_world()
+    cache = pytile.HighlightCache(max_size=2)
+    first = cache.get(1, 9)
+    assert cache.get(1, 9) is first
+    cache.get(2, 9)
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 2, 0)
+    # Using (1, 9) again makes (2, 9) the least recently used, so that's the one dropped
+    cache.get(1, 9)
+    cache.get(3, 1)
+    assert list(cache.entries) == [(1, 9), (3, 1)]
+    assert cache.stats() == {"size": 2, "max_size": 2, "hits": 2, "misses": 3, "evictions": 1}
+    cache.get(2, 9)
+    assert cache.misses == 4
+
+
+def test_default_size_holds_every_highlight(display):
+    display.paint_world()
+    cache = pytile.HighlightCache()
+    for _ in range(2):
+        for tile_type in range(len(heightfield.TILE_TYPES)):
+            for subtile in range(10):
+                cache.get(tile_type, subtile)
+    assert cache.evictions == 0
+    assert cache.misses == len(heightfield.TILE_TYPES) * 10
+    assert cache.hits == cache.misses
@@ -0,0 +1,34 @@
+import numpy
+
+import world
+
+
+def sprite_state(display):
+    """Return the type and rect of every sprite drawn for every tile"""
+    return {key: [(s.type, tuple(s.rect)) for s in sprites] for key, sprites in display.ordered_sprites_dict.items()}
+
+
+def test_undo_off_screen_tile_updates_cliffs_on_screen(display):
+    W = world.World
+    W.new_flat(40, 40)
+    W.set_offset(0, 0)
+    display.paint_world(rebuild=True)
+    visible = display.ordered_sprites_dict
+    # A tile off the screen with the tile behind it on screen, the cliffs of which depend on it
+    x, y = next((x, y) for x in range(1, W.WorldX) for y in range(W.WorldY)
+                if (x, y) not in visible and (x - 1, y) in visible)
+    xs = numpy.array([x - 1, x])
+    ys = numpy.array([y, y])
+    W.set_tiles(xs, ys, numpy.array([4, 4]), numpy.zeros(2, dtype=numpy.uint8))
+    W.begin_edit()
+    W.set_tiles(xs[1:], ys[1:], numpy.array([0]), numpy.zeros(1, dtype=numpy.uint8))
+    W.end_edit()
+    display.paint_world(rebuild=True)
+    assert len(display.ordered_sprites_dict[(x - 1, y)]) > 1
+
+    display.update_history(W.undo())
+    after_undo = sprite_state(display)
+    display.paint_world(rebuild=True)
+    rebuilt = sprite_state(display)
+    # Raising the tile may bring it into view, that only happens at the next paint
+    assert after_undo == {key: rebuilt[key] for key in after_undo}
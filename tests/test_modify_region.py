@@ -0,0 +1,93 @@
+import random
+
+import numpy
+import pytest
+
+import heightfield
+import terrain_gen
+import world
+
+SIZE = 24
+
+
+def modify_tiles(tiles, amount, op, lower):
+    """The Terrain tool's old loop, one tile at a time through World.modify_tile
+    Every level the lowest (highest when lowering) tiles of the region are modified, and when lowering
+    the change of the last of them in brush order is added up"""
+    W = world.World
+    points = []
+    for x, y in tiles:
+        height, packed = W.store.get(x, y)
+        if lower:
+            points.append([height + max(heightfield.unpack_vertices(packed)), (x, y)])
+        else:
+            points.append([height, (x, y)])
+    r = 0
+    for _ in range(amount):
+        if lower:
+            level = max(p[0] for p in points)
+            if level == 0:
+                continue
+        else:
+            level = min(p[0] for p in points)
+        rr = 0
+        for point in points:
+            if point[0] == level:
+                point[0] += -1 if lower else 1
+                if op is not None:
+                    rr = W.modify_tile(op, point[1])
+        if lower:
+            r += rr
+    return r
+
+
+def copy_store(store):
+    return heightfield.DenseStore(store.size_x, store.size_y, store.heights.copy(), store.vertices.copy())
+
+
+def world_tiles():
+    W = world.World
+    xs, ys = numpy.indices((W.WorldX, W.WorldY))
+    heights, packed = W.store.gather(xs.ravel(), ys.ravel())
+    return numpy.array(heights), numpy.array(packed)
+
+
+def random_brush(rng):
+    """A unique list of tiles in a random order, as a brush may give them"""
+    x0, y0 = rng.randrange(SIZE - 6), rng.randrange(SIZE - 6)
+    tiles = [(x, y) for x in range(x0, x0 + rng.randrange(1, 7)) for y in range(y0, y0 + rng.randrange(1, 7))]
+    rng.shuffle(tiles)
+    return tiles
+
+
+@pytest.mark.parametrize("lower", [False, True])
+@pytest.mark.parametrize("invalid", [False, True])
+def test_matches_per_tile_loop(lower, invalid):
+    rng = random.Random(8 + lower + 2 * invalid)
+    for trial in range(60):
+        store = terrain_gen.generate(SIZE, SIZE, seed=trial, max_height=6, scale=8, sea_level=0.1)
+        if invalid:
+            # Some tiles which aren't one of the valid vertex patterns, they go through TGrid
+            for _ in range(10):
+                store.set(rng.randrange(SIZE), rng.randrange(SIZE), rng.randrange(4),
+                          heightfield.pack_vertices([rng.randrange(3) for _ in range(4)]))
+        tiles = random_brush(rng)
+        amount = rng.randrange(1, 8)
+        subtile = rng.randrange(10)
+        op = world.subtile_op(subtile, lower)
+
+        world.World.set_store(copy_store(store))
+        expected_r = modify_tiles(tiles, amount, op, lower)
+        expected = world_tiles()
+
+        world.World.set_store(copy_store(store))
+        if lower:
+            r = world.World.lower_region(tiles, amount, subtile)
+        else:
+            r = world.World.raise_region(tiles, amount, subtile)
+        heights, packed = world_tiles()
+
+        assert (heights == expected[0]).all(), trial
+        assert (packed == expected[1]).all(), trial
+        if lower:
+            assert r == expected_r, trial
@@ -0,0 +1,80 @@
+import pygame
+import pytest
+
+import world
+
+p = 64
+p2 = 32
+p4 = 16
+ph = 8
+
+
+def brute_force_visible(display):
+    """Every tile whose image, or the cliffs under it down to ground level, overlaps the screen"""
+    W = display.world
+    screen = pygame.Rect(W.dxoff, W.dyoff, display.screen_width, display.screen_height)
+    visible = set()
+    for x in range(W.WorldX):
+        for y in range(W.WorldY):
+            x_pos = W.WorldWidth2 - x * p2 + y * p2 - p2
+            top = (x + y) * p4 - W.get_tile(x, y)[0] * ph
+            bottom = (x + y) * p4 + p
+            if screen.colliderect(pygame.Rect(x_pos, top, p, bottom - top)):
+                visible.add((x, y))
+    return visible
+
+
+def edge_offsets(W, width, height):
+    # Past each edge of the world image, and lined up with the tile grid
+    return [(-150, -200), (W.WorldWidth - width + 90, W.WorldHeight - height + 70), (-width + 20, 0),
+            (W.WorldWidth - 20, 100), (0, -height + 10), (200, W.WorldHeight - 10),
+            (W.WorldWidth2 - 9 * p2, 5 * p4), (W.WorldWidth2 - 9 * p2 + 1, 5 * p4 - 1)]
+
+
+def test_visible_tiles_at_the_edges(display):
+    W = display.world
+    # Something tall to reach up into the view from below
+    W.raise_region([(x, y) for x in range(3, 6) for y in range(3, 6)], 12)
+    for offset in edge_offsets(W, display.screen_width, display.screen_height):
+        W.set_offset(*offset)
+        visible = display.visible_tiles()
+        assert len(visible) == len(set(visible))
+        assert set(visible) == brute_force_visible(display), offset
+        # None of the sprites drawn for the other tiles are on screen
+        screen = pygame.Rect(W.dxoff, W.dyoff, display.screen_width, display.screen_height)
+        for x in range(W.WorldX):
+            for y in range(W.WorldY):
+                if (x, y) not in visible:
+                    assert not any(screen.colliderect(s.rect) for s in display.make_tile_sprites(x, y))
+
+
+def paint(display, **kwargs):
+    """Paint the world in a frame of its own, returns the number of sprites created"""
+    display.profiler.begin_frame()
+    display.paint_world(**kwargs)
+    return display.profiler.end_frame()["sprites_created"]
+
+
+@pytest.mark.parametrize("move", [(64, 32), (-200, 0), (0, -90)])
+def test_sprites_are_reused(display, move):
+    W = display.world
+    W.set_offset(100, 50)
+    assert paint(display) > 0
+    before = dict(display.ordered_sprites_dict)
+    pooled = len(display.sprite_pool)
+
+    W.set_offset(100 + move[0], 50 + move[1])
+    created = paint(display)
+    after = display.ordered_sprites_dict
+    # Tiles still in view keep their sprites
+    for key in set(before) & set(after):
+        assert after[key] is before[key]
+    # Sprites of tiles gone out of view are used for the ones coming into view before any are made
+    needed = sum(len(after[key]) for key in set(after) - set(before))
+    freed = sum(len(before[key]) for key in set(before) - set(after))
+    assert created == max(needed - freed - pooled, 0)
+
+    # Painting everything again makes no new sprites
+    sprites = {id(s) for tile_set in after.values() for s in tile_set} | {id(s) for s in display.sprite_pool}
+    assert paint(display, rebuild=True) == 0
+    assert {id(s) for tile_set in display.ordered_sprites_dict.values() for s in tile_set} <= sprites
@@ -0,0 +1,82 @@
+import numpy
+import pytest
+
+import heightfield
+import terrain_gen
+import tools
+import world
+
+MASK_ARRAYS = {}
+
+
+def mask_array(mask):
+    """The bits of a pygame mask as a [y, x] bool array"""
+    if id(mask) not in MASK_ARRAYS:
+        width, height = mask.get_size()
+        MASK_ARRAYS[id(mask)] = (mask, numpy.array([[mask.get_at((x, y)) for x in range(width)]
+                                                    for y in range(height)], dtype=bool))
+    return MASK_ARRAYS[id(mask)][1]
+
+
+def front_sprites(display):
+    """Return a [y, x] array of the index of the sprite in front at each screen pixel, -1 for none"""
+    width, height = display.screen_width, display.screen_height
+    owner = numpy.full((height, width), -1)
+    dxoff, dyoff = display.world.get_offset()
+    for i, sprite in enumerate(display.ordered_sprites.sprites()):
+        x, y = sprite.rect[0] - dxoff, sprite.rect[1] - dyoff
+        mask = mask_array(sprite.mask)
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + mask.shape[1], width), min(y + mask.shape[0], height)
+        if x0 < x1 and y0 < y1:
+            owner[y0:y1, x0:x1][mask[y0 - y:y1 - y, x0 - x:x1 - x]] = i
+    return owner
+
+
+def check_picking(display, monkeypatch):
+    display.paint_world(rebuild=True)
+    sprites = display.ordered_sprites.sprites()
+    owner = front_sprites(display)
+    picked = {"raised": 0, "sloped": 0, "cliffs": 0}
+    for (x, y), tile_set in display.ordered_sprites_dict.items():
+        ys, xs = numpy.nonzero(owner == sprites.index(tile_set[0]))
+        if not len(xs):
+            continue
+        # A pixel of the tile's face which nothing is drawn over
+        pos = int(xs[len(xs) // 2]), int(ys[len(ys) // 2])
+        tile = tools.Tool.pick_tile(pos)
+        assert (tile.x_world, tile.y_world) == (x, y), pos
+        height, packed = world.World.store.get(x, y)
+        picked["raised"] += height > 0
+        picked["sloped"] += heightfield.PACKED_TO_TILE_TYPE[packed] != 0
+        picked["cliffs"] += len(tile_set) > 1
+    assert all(picked.values()), picked
+
+    # Anywhere on the screen, cliffs and empty space included, the same as testing against the sprites
+    tool = tools.Terrain()
+    rng = numpy.random.RandomState(11)
+    for pos in zip(rng.randint(0, display.screen_width, 2000), rng.randint(0, display.screen_height, 2000)):
+        pos = int(pos[0]), int(pos[1])
+        monkeypatch.setattr(tools.Tool, "precise_picking", True)
+        by_sprite = tool.collide_locate(pos, display.ordered_sprites)
+        monkeypatch.setattr(tools.Tool, "precise_picking", False)
+        by_projection = tool.collide_locate(pos, display.ordered_sprites)
+        if by_sprite is None:
+            assert by_projection is None, pos
+        else:
+            assert (by_projection.x_world, by_projection.y_world) == (by_sprite.x_world, by_sprite.y_world), pos
+
+
+@pytest.mark.parametrize("offset", [(0, 0), (300, 60)])
+def test_picks_the_demo_map(display, monkeypatch, offset):
+    display.world.set_offset(*offset)
+    check_picking(display, monkeypatch)
+
+
+def test_picks_a_generated_map(display, monkeypatch):
+    world.World.set_store(terrain_gen.generate(64, 64, seed=4, max_height=12, scale=16))
+    display.world = world.World()
+    # Generated terrain is smooth, a raised block gives it some cliffs
+    world.World.raise_region([(x, y) for x in range(28, 34) for y in range(30, 36)], 6)
+    display.world.set_offset(display.world.WorldWidth2 - 400, display.world.WorldHeight // 2 - 300)
+    check_picking(display, monkeypatch)
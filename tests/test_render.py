@@ -0,0 +1,172 @@
+import random
+
+import pygame
+
+import pytile
+import render
+import terrain_gen
+import world
+
+
+class FakeWorld(object):
+    def __init__(self, offset=(0, 0)):
+        self.offset = offset
+
+    def get_offset(self):
+        return self.offset
+
+
+class FakeSprite(object):
+    def __init__(self, rect):
+        self.rect = pygame.Rect(rect)
+
+
+def brute_force(draw_list, rect):
+    dxoff, dyoff = draw_list.world.get_offset()
+    rect = pygame.Rect(rect).move(dxoff, dyoff)
+    return [s for s in draw_list.sprites() if rect.colliderect(s.rect)]
+
+
+def test_sprites_in_matches_every_sprite():
+    rng = random.Random(1)
+    draw_list = render.DrawList(FakeWorld((37, -11)))
+    for _ in range(3000):
+        key = (rng.randrange(40), rng.randrange(40))
+        if rng.random() < 0.1:
+            draw_list.remove(key)
+            continue
+        sprites = [FakeSprite((rng.randrange(-100, 2000), rng.randrange(-100, 1000), 64, rng.choice([16, 64, 200])))
+                   for _ in range(rng.randrange(1, 4))]
+        draw_list.set(key, (key[0] + key[1]) * 10 + rng.choice([0, 0, 5]), sprites)
+    rects = [(rng.randrange(-50, 1900), rng.randrange(-50, 900), rng.randrange(0, 300), rng.randrange(0, 300))
+             for _ in range(200)]
+    for rect, found in zip(rects, draw_list.sprites_in(rects)):
+        assert found == brute_force(draw_list, rect)
+
+
+def test_ordered_kept_up_to_date():
+    rng = random.Random(2)
+    draw_list = render.DrawList(FakeWorld())
+    for _ in range(2000):
+        key = rng.randrange(200)
+        if rng.random() < 0.2:
+            draw_list.remove(key)
+        else:
+            draw_list.set(key, rng.randrange(30), [FakeSprite((0, 0, 1, 1)) for _ in range(rng.randrange(1, 4))])
+    entries = sorted(draw_list.entries.values(), key=lambda e: e[:2])
+    assert draw_list.sprites() == [sprite for depth, order, sprites in entries for sprite in sprites]
+    assert len(draw_list) == len(draw_list.sort_keys)
+
+
+def test_set_keeps_place_within_bucket():
+    draw_list = render.DrawList(FakeWorld())
+    a, b, c = FakeSprite((0, 0, 10, 10)), FakeSprite((0, 0, 10, 10)), FakeSprite((0, 0, 10, 10))
+    draw_list.set("a", 1, [a])
+    draw_list.set("b", 1, [b])
+    draw_list.set("c", 0, [c])
+    # Set again at the same depth it stays where it was, at a new depth it goes last
+    draw_list.set("a", 1, [a])
+    assert draw_list.sprites() == [c, a, b]
+    assert draw_list.sprites_in([(5, 5, 1, 1)]) == [[c, a, b]]
+    draw_list.set("c", 1, [c])
+    assert draw_list.sprites() == [a, b, c]
+    draw_list.remove("b")
+    assert draw_list.sprites_in([(0, 0, 10, 10)]) == [[a, c]]
+
+
+def test_chunked_edit_keeps_index_up_to_date(display):
+    display.set_chunk_size(4)
+    # Raised tiles make their chunks taller
+    tiles = [(x, y) for x in range(4, 8) for y in range(4, 8)]
+    display.world.raise_region(tiles, 12)
+    display.update_world(tiles)
+    chunks = [chunk for chunk in display.ordered_sprites if (chunk.cx, chunk.cy) == (1, 1)]
+    assert chunks
+    for chunk in chunks:
+        # The top of the chunk is only there since it was raised
+        top = pygame.Rect(display.world.world_to_screen(chunk.rect))
+        top.height = 1
+        assert chunk in display.ordered_sprites.sprites_in([top])[0]
+
+
+def test_chunks_draw_the_same_as_tiles(display):
+    # Whole world images, then again after an edit which changes cliffs across chunk edges
+    for edit in (False, True):
+        if edit:
+            world.World.raise_region([(x, y) for x in range(6, 11) for y in range(3, 9)], 3)
+        images = [pygame.image.tostring(pytile.render_world(display.world, chunk_size=chunk_size), "RGB")
+                  for chunk_size in (None, 8, 5)]
+        assert images[0] == images[1]
+        assert images[0] == images[2]
+
+
+def test_chunk_update_matches_repaint(display):
+    display.set_chunk_size(6)
+    display.world.set_offset(100, 50)
+    display.paint_world()
+    display.draw_frame()
+    tiles = [(x, y) for x in range(4, 9) for y in range(4, 9)]
+    display.world.lower_region(tiles, 2)
+    display.update_world(tiles)
+    # Only the dirty rects are drawn
+    assert display.dirty and not display.dirty.full
+    display.draw_frame()
+    updated = pygame.image.tostring(display.screen, "RGB")
+    display.paint_world(rebuild=True)
+    display.draw_frame()
+    assert pygame.image.tostring(display.screen, "RGB") == updated
+
+
+def test_dirty_region_merges_touching_rects():
+    region = render.DirtyRegion(800, 600)
+    region.append((10, 10, 20, 20))
+    region.append((100, 100, 10, 10))
+    assert len(region) == 2
+    # Touches the first one
+    region.append((30, 10, 5, 5))
+    assert sorted(map(tuple, region)) == [(10, 10, 25, 20), (100, 100, 10, 10)]
+    # Overlaps both, which merge into one
+    region.append((20, 20, 85, 85))
+    assert list(map(tuple, region)) == [(10, 10, 100, 100)]
+
+
+def test_dirty_region_clips_to_the_screen():
+    region = render.DirtyRegion(800, 600)
+    region.append((-50, -50, 60, 70))
+    region.append((900, 10, 10, 10))
+    region.append((10, 10, 0, 10))
+    assert list(map(tuple, region)) == [(0, 0, 10, 20)]
+
+
+def test_dirty_region_goes_full_past_the_threshold():
+    region = render.DirtyRegion(100, 100, full_threshold=0.5)
+    region.append((0, 0, 50, 50))
+    region.append((60, 60, 40, 40))
+    assert not region.full
+    # 2500 + 1600 + 1000 covers more than half the screen
+    region.append((0, 80, 50, 20))
+    assert region.full
+    assert list(map(tuple, region)) == [(0, 0, 100, 100)]
+    # Nothing more is added once it's full, until it's reset
+    region.append((5, 5, 1, 1))
+    assert len(region) == 1
+    region.reset()
+    assert not region.full and len(region) == 0
+    region.resize(200, 100)
+    assert region.full and list(map(tuple, region)) == [(0, 0, 200, 100)]
+
+
+def test_chunk_cache_stays_within_its_cap(display):
+    world.World.set_store(terrain_gen.generate(128, 128, seed=2))
+    display.world = world.World()
+    display.set_chunk_size(8)
+    chunks = display.chunks
+    rendered = set()
+    for step in range(40):
+        display.world.set_offset(step * 180, 1500 + step * 20)
+        display.paint_world()
+        rendered.update(chunks.chunks)
+        assert len(chunks.chunks) <= chunks.cache_views * len(chunks.visible)
+        assert all(key in chunks.chunks for key in chunks.visible)
+    # Panning went past far more chunks than were kept
+    assert len(rendered) > chunks.max_cached()
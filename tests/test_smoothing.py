@@ -0,0 +1,129 @@
+import random
+
+import numpy
+import pytest
+
+import heightfield
+import smoothing
+import terrain_gen
+import world
+
+SIZE = 32
+
+# Neighbours and the vertices they share as the old Terrain.soften had them
+C_X = [1, 1, -1, -1, 0, 1, 0, -1]
+C_Y = [-1, 1, 1, -1, -1, 0, 1, 0]
+C_A = [(0, None), (1, None), (2, None), (3, None), (3, 0), (0, 1), (1, 2), (2, 3)]
+C_B = [(2, None), (3, None), (0, None), (1, None), (2, 1), (3, 2), (0, 3), (1, 0)]
+
+
+def old_soften(tiles, up):
+    """Terrain.soften as it was before soften_region, returns the tiles it changed"""
+    W = world.World
+    to_check = {t: W.get_height(t) for t in tiles}
+    checked = {}
+    aoe = set()
+    while to_check:
+        checking = to_check
+        to_check = {}
+        for key, value in checking.items():
+            for x, y, a, b in zip(C_X, C_Y, C_A, C_B):
+                x = key[0] + x
+                y = key[1] + y
+                if (x, y) in checked or (x, y) in checking:
+                    continue
+                potential = to_check[(x, y)] if (x, y) in to_check else W.get_height(x, y)
+                if potential is None:
+                    continue
+                m = 0
+                for aa, bb in zip(a, b):
+                    if aa is None:
+                        continue
+                    if up:
+                        while value[aa] + value.height > potential[bb] + potential.height:
+                            potential.raise_vertex(bb)
+                            m = 1
+                    else:
+                        while value[aa] + value.height < potential[bb] + potential.height:
+                            potential.lower_vertex(bb)
+                            m = 1
+                if m:
+                    to_check[(x, y)] = potential
+                    aoe.add((x, y))
+        checked.update(checking)
+    for k, tgrid in checked.items():
+        W.set_height(tgrid, k)
+    return aoe
+
+
+def copy_store(store):
+    return heightfield.DenseStore(store.size_x, store.size_y, store.heights.copy(), store.vertices.copy())
+
+
+def world_tiles():
+    xs, ys = numpy.indices((world.World.WorldX, world.World.WorldY))
+    heights, packed = world.World.store.gather(xs.ravel(), ys.ravel())
+    return numpy.array(heights), numpy.array(packed)
+
+
+@pytest.mark.parametrize("up", [True, False])
+def test_matches_old_soften(up):
+    rng = random.Random(9 + up)
+    for trial in range(30):
+        store = terrain_gen.generate(SIZE, SIZE, seed=trial, max_height=8, scale=12, sea_level=0.2)
+        x0, y0 = rng.randrange(SIZE - 5), rng.randrange(SIZE - 5)
+        tiles = [(x, y) for x in range(x0, x0 + rng.randrange(1, 5)) for y in range(y0, y0 + rng.randrange(1, 5))]
+        world.World.set_store(store)
+        # Make a step for the softening to smooth out
+        if up:
+            world.World.raise_region(tiles, rng.randrange(1, 6), rng.randrange(1, 10))
+        else:
+            world.World.lower_region(tiles, rng.randrange(1, 6), rng.randrange(1, 10))
+        edited = copy_store(world.World.store)
+
+        world.World.set_store(copy_store(edited))
+        expected_tiles = old_soften(tiles, up)
+        expected = world_tiles()
+
+        world.World.set_store(copy_store(edited))
+        result = smoothing.soften_region(tiles, up)
+        heights, packed = world_tiles()
+
+        assert (heights == expected[0]).all(), trial
+        assert (packed == expected[1]).all(), trial
+        assert set(result.tiles()) == expected_tiles, trial
+
+
+def spike(height=10):
+    """Flat World with one tile in the middle raised by height"""
+    world.World.new_flat(SIZE, SIZE)
+    world.World.raise_region([(SIZE // 2, SIZE // 2)], height)
+
+
+def chebyshev(tiles):
+    return max(max(abs(x - SIZE // 2), abs(y - SIZE // 2)) for x, y in tiles)
+
+
+def test_unlimited_spreads_all_the_way():
+    spike()
+    assert chebyshev(smoothing.soften_region([(SIZE // 2, SIZE // 2)]).tiles()) == 10
+
+
+def test_radius_stops_the_waves():
+    spike()
+    changed = smoothing.soften_region([(SIZE // 2, SIZE // 2)], radius=3).tiles()
+    assert chebyshev(changed) == 3
+    # Beyond the radius the World is untouched
+    heights, _ = world_tiles()
+    assert heights.reshape(SIZE, SIZE)[SIZE // 2 - 3:SIZE // 2 + 4, SIZE // 2 - 3:SIZE // 2 + 4].sum() == \
+        heights.sum()
+
+
+def test_budget_stops_the_waves():
+    spike()
+    # The first wave changes the 8 neighbours, which uses up the budget
+    changed = smoothing.soften_region([(SIZE // 2, SIZE // 2)], budget=5).tiles()
+    assert len(changed) == 8
+    assert chebyshev(changed) == 1
+    spike()
+    assert len(smoothing.soften_region([(SIZE // 2, SIZE // 2)], budget=9).tiles()) == 8 + 16
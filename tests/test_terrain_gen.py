@@ -0,0 +1,37 @@
+import numpy
+import pytest
+
+import heightfield
+import terrain_gen
+
+
+def corner_heights(store):
+    """Absolute [left, bottom, right, top] vertex heights of every tile"""
+    heights = numpy.asarray(store.heights, dtype=numpy.int32)
+    return heights[..., None] + heightfield.unpack_vertex_array(numpy.asarray(store.vertices))
+
+
+@pytest.mark.parametrize("size_x, size_y, seed, max_height", [
+    (1, 1, 0, 16), (17, 40, 1, 16), (64, 64, 2, 4), (100, 37, 3, 30), (128, 128, 4, 16)])
+def test_generates_valid_terrain(size_x, size_y, seed, max_height):
+    store = terrain_gen.generate(size_x, size_y, seed=seed, max_height=max_height, scale=16)
+    assert (store.heights.shape, store.vertices.shape) == ((size_x, size_y), (size_x, size_y))
+    # Every tile is one of the valid vertex patterns
+    assert (heightfield.PACKED_TO_TILE_TYPE_ARRAY[store.vertices] >= 0).all()
+    corners = corner_heights(store)
+    assert store.heights.min() >= 0
+    assert corners.max() <= max_height
+    # Vertices shared with the next tile along x and along y are at the same height
+    assert (corners[:-1, :, 0] == corners[1:, :, 3]).all()
+    assert (corners[:-1, :, 1] == corners[1:, :, 2]).all()
+    assert (corners[:, :-1, 2] == corners[:, 1:, 3]).all()
+    assert (corners[:, :-1, 1] == corners[:, 1:, 0]).all()
+
+
+def test_fixed_seed_gives_the_same_terrain():
+    first = terrain_gen.generate(80, 60, seed=7)
+    second = terrain_gen.generate(80, 60, seed=7)
+    other = terrain_gen.generate(80, 60, seed=8)
+    assert (first.heights == second.heights).all()
+    assert (first.vertices == second.vertices).all()
+    assert (first.heights != other.heights).any()
@@ -0,0 +1,60 @@
+import numpy
+import pytest
+
+import heightfield
+import terrain_gen
+import tools
+import world
+
+ph = 8
+
+
+def copy_store(store):
+    return heightfield.DenseStore(store.size_x, store.size_y, store.heights.copy(), store.vertices.copy())
+
+
+def world_tiles():
+    xs, ys = numpy.indices((world.World.WorldX, world.World.WorldY))
+    heights, packed = world.World.store.gather(xs.ravel(), ys.ravel())
+    return numpy.array(heights), numpy.array(packed)
+
+
+def drag(tile, subtile, moves):
+    """Drag the Terrain tool on a tile, updating after each list of cursor moves, returns the tool"""
+    tool = tools.Terrain()
+    tool.tiles = [tile]
+    tool.subtile = subtile
+    tool.start = tool.current = (0, 500)
+    tool.addback = 0
+    world.World.begin_edit()
+    y = 500
+    for dy in moves:
+        y += dy
+        tool.current = (0, y)
+        tool.update()
+    world.World.end_edit()
+    return tool
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_coalesced_drag_matches_one_level_at_a_time(seed):
+    store = terrain_gen.generate(64, 64, seed=seed)
+    rng = numpy.random.RandomState(seed)
+    tiles = [tuple(int(v) for v in rng.randint(0, 64, size=2)) for _ in range(3)]
+    for subtile in range(1, 10):
+        for levels in (2, 3, 4):
+            for direction in (1, -1):
+                for tile in tiles:
+                    # Down the screen lowers, and back up again
+                    moves = [direction * ph] * levels + [-direction * ph] * (levels + 1)
+                    world.World.set_store(copy_store(store))
+                    one_tool = drag(tile, subtile, moves)
+                    one_level = world_tiles()
+
+                    world.World.set_store(copy_store(store))
+                    coalesced_tool = drag(tile, subtile, [direction * ph * levels, -direction * ph * (levels + 1)])
+                    coalesced = world_tiles()
+
+                    assert (coalesced[0] == one_level[0]).all(), (tile, subtile, levels, direction)
+                    assert (coalesced[1] == one_level[1]).all(), (tile, subtile, levels, direction)
+                    assert coalesced_tool.addback == one_tool.addback
@@ -0,0 +1,33 @@
+import numpy
+
+import heightfield
+import world
+
+SEQUENCES = 20000
+STEPS = 8
+
+
+def test_tables_match_general_path(monkeypatch):
+    rng = numpy.random.RandomState(6)
+    tile_types = rng.randint(0, len(heightfield.TILE_TYPE_VERTICES), size=SEQUENCES)
+    heights = rng.randint(0, 3, size=SEQUENCES)
+    ops = rng.randint(0, world.NUM_OPS, size=(STEPS, SEQUENCES))
+
+    # Whole arrays at a time through the tables
+    table_heights = heights.astype(numpy.int16)
+    table_packed = heightfield.TILE_TYPE_TO_PACKED_ARRAY[tile_types]
+    table_changes = []
+    for step in range(STEPS):
+        table_heights, table_packed, change = world.apply_transitions(table_heights, table_packed, ops[step])
+        table_changes.append(change)
+
+    # Tile by tile through TGrid, with the tables turned off and then on
+    for transitions in (None, world.TGrid.transitions):
+        monkeypatch.setattr(world.TGrid, "transitions", transitions)
+        for i in range(SEQUENCES):
+            tgrid = world.TGrid(int(heights[i]), list(heightfield.TILE_TYPE_VERTICES[tile_types[i]]))
+            for step in range(STEPS):
+                change = world.run_op(tgrid, int(ops[step, i]))
+                assert change == table_changes[step][i], (i, step)
+            assert tgrid.height == table_heights[i], i
+            assert heightfield.pack_vertices(tgrid.array) == table_packed[i], i
@@ -0,0 +1,67 @@
+import struct
+
+import numpy
+
+import heightfield
+import terrain_gen
+import world
+import world_file
+
+
+def test_save_load_round_trip(tmp_path):
+    store = terrain_gen.generate(40, 30, seed=3)
+    paths = {(1, 2): [[0, 14], [2, 12]]}
+    filename = str(tmp_path / "map.ptw")
+    world_file.save(filename, store, paths)
+    loaded, loaded_paths = world_file.load(filename)
+    assert (numpy.asarray(loaded.heights) == store.heights).all()
+    assert (numpy.asarray(loaded.vertices) == store.vertices).all()
+    assert loaded_paths == paths
+
+
+def test_max_height_comes_from_the_header(tmp_path):
+    store = terrain_gen.generate(64, 64, seed=5)
+    filename = str(tmp_path / "map.ptw")
+    world_file.save(filename, store, {})
+    loaded, _ = world_file.load(filename)
+    assert loaded.height_bound == int(store.heights.max())
+
+    # Finding the bound mustn't read the height plane
+    class Unreadable(object):
+        size = loaded.heights.size
+
+        def max(self):
+            raise AssertionError("height plane read")
+
+    loaded.heights = Unreadable()
+    assert loaded.max_height() == int(store.heights.max())
+
+
+def test_edits_raise_the_stored_bound(tmp_path):
+    filename = str(tmp_path / "map.ptw")
+    world_file.save(filename, heightfield.DenseStore(16, 16), {})
+    world.World.load_file(filename)
+    assert world.World.get_height_bound() == 0
+    world.World.raise_region([(3, 3)], 4)
+    assert world.World.store.height_bound == 4
+    world.World.height_bound = None
+    assert world.World.get_height_bound() == 4
+
+
+def test_version_1_files_have_no_bound(tmp_path):
+    store = terrain_gen.generate(16, 16, seed=1)
+    filename = str(tmp_path / "map.ptw")
+    world_file.save(filename, store, {})
+    with open(filename, "r+b") as f:
+        f.seek(4)
+        f.write(struct.pack("<H", 1))
+    loaded, _ = world_file.load(filename)
+    assert loaded.height_bound is None
+    assert loaded.max_height() == int(store.heights.max())
+
+
+def test_writable_maps_dont_trust_the_header(tmp_path):
+    filename = str(tmp_path / "map.ptw")
+    world_file.save(filename, terrain_gen.generate(16, 16, seed=1), {})
+    loaded, _ = world_file.load(filename, mode="r+")
+    assert loaded.height_bound is None
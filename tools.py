@@ -1,7 +1,10 @@
+import collections
 import copy
 
 import pygame
 
+import heightfield
+import smoothing
 import world
 
 World = world.World()
@@ -42,8 +45,36 @@ class MouseSprite(pygame.sprite.Sprite):
         self.rect = pygame.Rect(x, y, 1, 1)
 
 
+class PickedTile(object):
+    """A tile found under the cursor, has the same attributes as the TileSprite it's drawn with"""
+    exclude = False
+
+    def __init__(self, x_world, y_world, z_world, type_):
+        self.x_world = x_world
+        self.y_world = y_world
+        self.z_world = z_world
+        self.type = type_
+
+    def __eq__(self, other):
+        return (isinstance(other, PickedTile) and
+                (self.x_world, self.y_world, self.z_world, self.type) ==
+                (other.x_world, other.y_world, other.z_world, other.type))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.x_world, self.y_world, self.z_world, self.type))
+
+
 class Tool(object):
     """Methods which all tools can access"""
+    # Pick tiles by testing the cursor against the masks of all the sprites, rather than working it out
+    # from the World, slower but exact to the pixel
+    precise_picking = False
+    # Masks of the tile images indexed by tile type, set once the images are loaded
+    # Until then tiles are picked using the hitbox tables, which are only accurate to 8 by 4 pixels
+    tile_masks = None
 
     def __init__(self):
         """"""
@@ -84,6 +115,10 @@ class Tool(object):
         """Tool updated, current cursor position is newpos"""
         pass
 
+    def update(self):
+        """Apply the input received since the last frame, called once per frame after the events are handled"""
+        pass
+
     # AOE related access functions
     def get_aoe(self):
         """Return the current area of effect for this tool"""
@@ -130,12 +165,53 @@ class Tool(object):
         return True
 
     def collide_locate(self, mousepos, collideagainst):
+        """Locates the tile that the mouse position intersects with"""
+        if Tool.precise_picking:
+            return self.collide_locate_sprites(mousepos, collideagainst)
+        return self.pick_tile(mousepos)
+
+    @staticmethod
+    def pick_tile(mousepos):
+        """Find the tile under a screen position by inverting the projection used to draw the tiles
+        Cliffs don't block the tiles behind them, as with collide_locate_sprites()
+        Returns a PickedTile or None"""
+        # Position within the whole world image
+        wx, wy = World.screen_to_world(mousepos)
+        # Tiles are drawn at x = WorldWidth2 + (y - x) * p2 - p2, p wide, so only the column of tiles with
+        # y - x == u (left half of the tile) and the one with y - x == u - 1 (right half) can cover wx
+        u = (wx - World.WorldWidth2 + p2) // p2
+        # and at y = (x + y) * p4 - height * ph, p high, so walk the diagonals of x + y front to back
+        # from the nearest one the highest tile could reach up from to the furthest one reaching down
+        front = min((wy + World.get_height_bound() * ph) // p4, World.WorldX + World.WorldY - 2)
+        back = max((wy - p) // p4, 0)
+        for d in range(front, back - 1, -1):
+            # x + y and y - x are always both odd or both even
+            column = u if (d - u) % 2 == 0 else u - 1
+            x = (d - column) // 2
+            y = (d + column) // 2
+            if not World.in_bounds(x, y):
+                continue
+            height, packed = World.store.get(x, y)
+            offy = wy - (d * p4 - height * ph)
+            tile_type = heightfield.PACKED_TO_TILE_TYPE[packed]
+            if 0 <= offy < p and tile_type >= 0:
+                offx = wx - (World.WorldWidth2 + column * p2 - p2)
+                if Tool.tile_masks is not None:
+                    hit = Tool.tile_masks[tile_type].get_at((offx, offy))
+                else:
+                    hit = World.hitbox[tile_type][offy // p16][offx // p8]
+                if hit:
+                    return PickedTile(x, y, height, tile_type)
+        return None
+
+    def collide_locate_sprites(self, mousepos, collideagainst):
         """Locates the sprite(s) that the mouse position intersects with"""
-        # Draw mouseSprite at cursor position
+        # Draw mouseSprite at cursor position, sprites are placed within the whole world image
+        position = World.screen_to_world(mousepos)
         if self.mouseSprite:
-            self.mouseSprite.sprite.update(*mousepos)
+            self.mouseSprite.sprite.update(*position)
         else:
-            self.mouseSprite = pygame.sprite.GroupSingle(MouseSprite(*mousepos))
+            self.mouseSprite = pygame.sprite.GroupSingle(MouseSprite(*position))
         # Find sprites that the mouseSprite intersects with
         collision_list1 = pygame.sprite.spritecollide(self.mouseSprite.sprite, collideagainst, False)
         if collision_list1:
@@ -158,12 +234,12 @@ class Tool(object):
         """Find the sub-tile position of the cursor"""
         x = tile.x_world
         y = tile.y_world
-        # Find where this tile would've been drawn on the screen, and subtract the mouse's position
-        mousex, mousey = mousepos
+        # Find where this tile is drawn within the whole world image, and subtract the mouse's position
+        mousex, mousey = World.screen_to_world(mousepos)
         posx = World.WorldWidth2 - x * p2 + y * p2 - p2
-        posy = x * p4 + y * p4 - World.array[x][y][0] * ph
-        offx = mousex - (posx - World.dxoff)
-        offy = mousey - (posy - World.dyoff)
+        posy = x * p4 + y * p4 - World.get_tile(x, y)[0] * ph
+        offx = mousex - posx
+        offy = mousey - posy
         # Then compare these offsets to the table of values for this particular kind of tile
         # to find which overlay selection sprite should be drawn
         # Height in 16th incremenets, width in 8th increments
@@ -171,7 +247,7 @@ class Tool(object):
         offy16 = int(offy / p16)
         # Then lookup the mask number based on this, this should be drawn on the screen
         try:
-            tilesubposition = World.type[tile.type][offy16][offx8]
+            tilesubposition = World.hitbox[tile.type][offy16][offx8]
             return tilesubposition
         except IndexError:
             # print("offy16: %s, offx8: %s, coltile: %s" % (offy16, offx8, tile.type))
@@ -224,6 +300,9 @@ class Terrain(Tool):
     xdims = 1
     ydims = 1
     smooth = False
+    # Limits on how far softening spreads (in tiles) and how many tiles it changes, None for no limit
+    soften_radius = None
+    soften_budget = None
 
     def __init__(self):
         """First time the Terrain tool is used"""
@@ -271,36 +350,34 @@ class Terrain(Tool):
         Used to specify region which will be highlighted"""
         tiles = {}
         if self.xdims > 1 or self.ydims > 1:
-            for xx in range(self.xdims):
-                for yy in range(self.ydims):
-                    try:
-                        World.array[x + xx][y + yy]
-                    except IndexError:
-                        pass
-                    else:
-                        t = copy.copy(World.array[x + xx][y + yy])
-                        if len(t) == 2:
-                            t.append([])
-                        t.append(9)
-                        tiles[(x + xx, y + yy)] = t
+            heights, vertices = World.get_region(x, y, x + self.xdims, y + self.ydims)
+            for xx in range(heights.shape[0]):
+                for yy in range(heights.shape[1]):
+                    tiles[(x + xx, y + yy)] = [int(heights[xx, yy]), vertices[xx, yy].tolist(),
+                                               World.get_paths(x + xx, y + yy), 9]
         else:
-            t = copy.copy(World.array[x][y])
-            if len(t) == 2:
-                t.append([])
-            t.append(subtile)
-            tiles[(x, y)] = t
+            height, vertices = World.get_tile(x, y)
+            tiles[(x, y)] = [height, list(vertices), World.get_paths(x, y), subtile]
         return tiles
 
     def mouse_down(self, position, collision_list):
         """Reset the start position for a new operation"""
         self.start = position
+        self.current = position
         self.addback = 0
+        # The tiles the drag works on are the ones it started on, moves may be coalesced so don't wait for one
+        self.pick_tiles(position, collision_list)
+        # The whole drag is one step of undo
+        World.begin_edit()
 
     def mouse_up(self, position, collision_list):
         """End of application of tool"""
+        # Finish off any movement not yet applied
+        self.update()
         self.current = position
         self.tiles = []
         self.start = None
+        World.end_edit()
 
     def mouse_move(self, position, collision_list):
         """Tool updated, current cursor position is newpos"""
@@ -329,228 +406,114 @@ class Terrain(Tool):
         else:
             # If we don't already have a list of tiles to use as the primary area of effect
             if not self.tiles:
-                tile = self.collide_locate(self.current, collision_list)
-                if tile and not tile.exclude:
-                    subtile = self.subtile_position(self.current, tile)
-                    self.tiles = self.find_rect_aoe(tile.x_world, tile.y_world)
-                    # Tiles now contains the primary area of effect for this operation
-                    self.tile = tile
-                    self.subtile = subtile
-
-            # We keep track of the mouse position in the y dimension, as it moves it ticks over 
-            # in ph size increments each time it does this we remove a ph size increment from 
-            # the start location, so that next time we start from the right place. If when we 
-            # actually try to modify the terrain by that number of ticks we find we're unable 
-            # to (e.g. we've hit a terrain limit) and the modification is less than the 
-            # requested modification the start position needs to be offset such that we have 
-            # to "make back" that offset.
-
-            # Coord system is from top-left corner, down = -ve, up = +ve, so do start pos - end pos
-            # This gets us the number of units to move up or down by
-            diff = int((self.start[1] - self.current[1]) / ph)
-            self.start = (self.start[0], self.start[1] - diff * ph)
-
-            # If diff < 0 we're lowering terrain, if diff > 0 we're raising it
-            # If raising, check if addback is positive, if so we need to zero out addback before doing any raising
-            # to the terrain
-            if diff > 0:
-                while self.addback > 0:
-                    if diff == 0:
-                        break
-                    diff -= 1
-                    self.addback -= 1
-
-            if diff != 0:
-                if len(self.tiles) > 1:
-                    r = self.modify_tiles(self.tiles, diff, soft=Terrain.smooth)
-                else:
-                    r = self.modify_tiles(self.tiles, diff, subtile=self.subtile, soft=Terrain.smooth)
-                # Addback is calcuated as the actual height change minus the requested height change. 
-                # The remainder is the amount of cursor movement which doesn't actually do anything.
-                # For example, if the cursor moves down (lowering the terrain) and hits the "0" level
-                # of the terrain we can't continue to lower the terrain. The cursor keeps moving 
-                # however and the addback value keeps track of this so that when the cursor starts to 
-                # move up it won't start raising the terrain until it hits the "0" level again
-
-                # If we're lowering, update addback if necessary
-                if diff < 0:
-                    self.addback += r - diff
-
-                # Set this so that the changed portion of the map is updated on screen
-                self.set_aoe_changed(True)
+                self.pick_tiles(self.current, collision_list)
+            # The terrain itself is changed by update(), once per frame however many moves there were
+
+    def pick_tiles(self, position, collision_list):
+        """Set the primary area of effect of a drag to the tiles around the one at position"""
+        tile = self.collide_locate(position, collision_list)
+        if tile and not tile.exclude:
+            subtile = self.subtile_position(position, tile)
+            self.tiles = self.find_rect_aoe(tile.x_world, tile.y_world)
+            # Tiles now contains the primary area of effect for this operation
+            self.tile = tile
+            self.subtile = subtile
+
+    def update(self):
+        """Raise or lower the terrain by the cursor movement since the last update"""
+        if self.start is None:
+            return
+        # We keep track of the mouse position in the y dimension, as it moves it ticks over 
+        # in ph size increments each time it does this we remove a ph size increment from 
+        # the start location, so that next time we start from the right place. If when we 
+        # actually try to modify the terrain by that number of ticks we find we're unable 
+        # to (e.g. we've hit a terrain limit) and the modification is less than the 
+        # requested modification the start position needs to be offset such that we have 
+        # to "make back" that offset.
+
+        # Coord system is from top-left corner, down = -ve, up = +ve, so do start pos - end pos
+        # This gets us the number of units to move up or down by
+        diff = int((self.start[1] - self.current[1]) / ph)
+        self.start = (self.start[0], self.start[1] - diff * ph)
+
+        # If diff < 0 we're lowering terrain, if diff > 0 we're raising it
+        # If raising, check if addback is positive, if so we need to zero out addback before doing any raising
+        # to the terrain
+        if diff > 0:
+            while self.addback > 0:
+                if diff == 0:
+                    break
+                diff -= 1
+                self.addback -= 1
+
+        if diff != 0:
+            subtile = 9 if len(self.tiles) > 1 else self.subtile
+            # Moving a vertex or edge several levels in one go doesn't always end up where moving it one level
+            # at a time does, and however the moves were coalesced a drag has to end up the same
+            if subtile in range(1, 9):
+                steps = [1 if diff > 0 else -1] * abs(diff)
+            else:
+                steps = [diff]
+            r = 0
+            aoe = []
+            World.begin_edit()
+            for step in steps:
+                r += self.modify_tiles(self.tiles, step, subtile=subtile, soft=Terrain.smooth)
+                aoe.extend(self.aoe)
+            World.end_edit()
+            self.aoe = list(collections.OrderedDict.fromkeys(aoe))
+            # Addback is calcuated as the actual height change minus the requested height change. 
+            # The remainder is the amount of cursor movement which doesn't actually do anything.
+            # For example, if the cursor moves down (lowering the terrain) and hits the "0" level
+            # of the terrain we can't continue to lower the terrain. The cursor keeps moving 
+            # however and the addback value keeps track of this so that when the cursor starts to 
+            # move up it won't start raising the terrain until it hits the "0" level again
+
+            # If we're lowering, update addback if necessary
+            if diff < 0:
+                self.addback += r - diff
+
+            # Set this so that the changed portion of the map is updated on screen
+            self.set_aoe_changed(True)
 
     def modify_tiles(self, tiles, amount, subtile=9, soft=False):
         """Raise or lower a region of tiles"""
         # r measures the total amount of raising/lowering *actually* done
         # This can then be compared with the amount requested to calculate the cursor offset
         r = 0
-        # The area of effect of the tool (list of tiles modified)
-        self.aoe = []
         # This will always be a whole tile raise/lower
         # If subtile is None, this is always a whole tile raise/lower
         # If subtile is something, and there's only one tile in the array then this is a single tile action
         # If subtile is something, and there's more than one tile in the array then this is a multi-tile action,
         # but based
         #   off a vertex rather than a face
-        vertices = []
-        # Lowering terrain, find maximum value to start from
+        # The area of effect of the tool (list of tiles modified)
+        self.aoe = [t for t in tiles if World.in_bounds(*t)]
+        World.begin_edit()
+        # Lowering terrain, starting from the highest tiles
         if amount < 0:
-            for t in tiles:
-                x = t[0]
-                y = t[1]
-                tgrid = World.get_height(x, y)
-                if tgrid:
-                    vertices.append([tgrid.height + max(tgrid.array), (x, y)])
-                    self.aoe.append((x, y))
-            step = -1
-            for i in range(0, amount, step):
-                maxval = max(vertices, key=lambda x: x[0])[0]
-                if maxval != 0:
-                    rr = 0
-                    for point in vertices:
-                        if point[0] == maxval:
-                            point[0] -= 1
-                            # Whole tile lower
-                            if subtile == 9:
-                                tgrid = World.get_height(point[1])
-                                rr = tgrid.lower_face()
-                                World.set_height(tgrid, point[1])
-                            # Edge lower
-                            elif subtile in [5, 6, 7, 8]:
-                                st1 = subtile - 5
-                                st2 = st1 + 1
-                                tgrid = World.get_height(point[1])
-                                rr = tgrid.lower_edge(st1, st2)
-                                World.set_height(tgrid, point[1])
-                            # Vertex lower
-                            elif subtile in [1, 2, 3, 4]:
-                                tgrid = World.get_height(point[1])
-                                rr = tgrid.lower_vertex(subtile - 1)
-                                World.set_height(tgrid, point[1])
-                    # Since we're potentially modifying a large number of individual tiles we only want to know if
-                    # *any* of them were lowered for the purposes of calculating the real raise/lower amount
-                    # Thus r should only be incremented once per raise/lower level
-                    r += rr
+            r = World.lower_region(self.aoe, -amount, subtile)
             if soft:
                 # Soften around the modified tiles
                 self.soften(self.aoe, soften_down=True)
-        # Raising terrain, find minimum value to start from
+        # Raising terrain, starting from the lowest tiles
         else:
-            for t in tiles:
-                x = t[0]
-                y = t[1]
-                tgrid = World.get_height(x, y)
-                if tgrid:
-                    vertices.append([tgrid.height, (x, y)])
-                    self.aoe.append((x, y))
-            step = 1
-            for i in range(0, amount, step):
-                # TODO: Fix it when "vertices" is empty
-                min_val = min(vertices, key=lambda x: x[0])[0]
-                for point in vertices:
-                    if point[0] == min_val:
-                        point[0] += 1
-                        # Whole tile raise
-                        if subtile == 9:
-                            tgrid = World.get_height(point[1])
-                            tgrid.raise_face()
-                            World.set_height(tgrid, point[1])
-                        # Edge raise
-                        elif subtile in [5, 6, 7, 8]:
-                            st1 = subtile - 5
-                            st2 = st1 + 1
-                            tgrid = World.get_height(point[1])
-                            tgrid.raise_edge(st1, st2)
-                            World.set_height(tgrid, point[1])
-                        # Vertex raise
-                        elif subtile in [1, 2, 3, 4]:
-                            tgrid = World.get_height(point[1])
-                            tgrid.raise_vertex(subtile - 1)
-                            World.set_height(tgrid, point[1])
+            World.raise_region(self.aoe, amount, subtile)
             if soft:
                 # Soften around the modified tiles
                 self.soften(self.aoe, soften_up=True)
+        World.end_edit()
         return r
 
     def soften(self, tiles, soften_up=False, soften_down=False):
         """Soften the tiles around a given set of tiles, raising them to make a smooth slope
         Can be set to either raise tiles to the same height or lower them"""
-        # Init stacks
-        to_check = {}
-        checked = {}
-        # Add all initial tiles to first stack
-        for t in tiles:
-            to_check[t] = World.get_height(t)
-
-        # Find any neighbours of this tile which have the same vertex height before we raise it
-        # Need to compare 4 corners and 4 edges
-        # Corners:
-        # x+1,y-1 -> 0:2
-        # x+1,y+1 -> 1:3
-        # x-1,y+1 -> 2:0
-        # x-1,y-1 -> 3:1
-        # Edges:
-        # x,y-1 -> 3:2,0:1
-        # x+1,y -> 0:3,1:2
-        # x,y+1 -> 1:0,2:3
-        # x-1,y -> 2:1,3:0
-        c_x = [1, 1, -1, -1, 0, 1, 0, -1]
-        c_y = [-1, 1, 1, -1, -1, 0, 1, 0]
-        c_a = [(0, None), (1, None), (2, None), (3, None), (3, 0), (0, 1), (1, 2), (2, 3)]
-        c_b = [(2, None), (3, None), (0, None), (1, None), (2, 1), (3, 2), (0, 3), (1, 0)]
-
-        while to_check:
-            # Checking should be empty from the end of the last loop
-            checking = to_check
-            # To check should be emptied at this point ready to add values this look
-            to_check = {}
-            for key, value in checking.items():
-                # Find all neighbours which haven't already been added to to_check and which aren't already
-                # Needs to be changed so that it checks if this tile has already been checked (will be speedier)
-                for x, y, a, b in zip(c_x, c_y, c_a, c_b):
-                    x = key[0] + x
-                    y = key[1] + y
-                    # Check if the potential tile has been checked before, if so use the existing object
-                    if (x, y) in checked:
-                        #                        potential = checked[(x,y)]
-                        potential = None
-                    elif (x, y) in checking:
-                        #                        potential = checking[(x,y)]
-                        potential = None
-                    elif (x, y) in to_check:
-                        potential = to_check[(x, y)]
-                    #                        potential = None
-                    # Otherwise create a new tile object for that tile
-                    else:
-                        potential = World.get_height(x, y)
-                    m = 0
-                    # If there is a tile to compare to (bounds check) and the comparison tile is lower
-                    if potential and soften_up:
-                        # Raise vertex to same height as the tile we're comparing against
-                        # Do this twice for edges, only once for corners
-                        for aa, bb in zip(a, b):
-                            while self.compare_vertex_higher(value, potential, aa, bb):
-                                potential.raise_vertex(bb)
-                                m = 1
-                    elif potential and soften_down:
-                        # Lower vertex to same height as the tile we're comparing against
-                        for aa, bb in zip(a, b):
-                            while self.compare_vertex_lower(value, potential, aa, bb):
-                                potential.lower_vertex(bb)
-                                m = 1
-                    elif potential:
-                        checked[(x, y)] = potential
-                    # Since we've modified this vertex, add it to the list to be checked next time around
-                    if m == 1:
-                        to_check[(x, y)] = potential
-                        self.aoe.append((x, y))
-
-            # Add the last iteration's checked values to the checked stack
-            checked.update(checking)
-
-        # Finally modify the world to reflect changes made by this tool
-        for k in checked.keys():
-            World.set_height(checked[k], k)
+        if not soften_up and not soften_down:
+            return None
+        result = smoothing.soften_region(tiles, up=soften_up, radius=Terrain.soften_radius,
+                                         budget=Terrain.soften_budget)
+        self.aoe.extend(result.tiles())
+        return result
 
     @staticmethod
     def compare_vertex_higher(tgrid1, tgrid2, v1, v2):
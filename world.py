@@ -1,3 +1,8 @@
+import numpy
+
+import edit_journal
+import heightfield
+import world_file
 from demo_map import tile_map
 p = 64
 p2 = int(p / 2)
@@ -10,9 +15,26 @@ p16 = int(p / 16)
 ph = 8
 
 
+# Terrain operations which can be looked up in the transition tables
+# Vertex and edge operations are followed by the vertex/first vertex of the edge, e.g. OP_RAISE_VERTEX + 2
+OP_RAISE_FACE = 0
+OP_LOWER_FACE = 1
+OP_RAISE_VERTEX = 2
+OP_LOWER_VERTEX = 6
+OP_RAISE_EDGE = 10
+OP_LOWER_EDGE = 14
+NUM_OPS = 18
+
+
 class TGrid(object):
     """Represents a tile's vertex height and can be used to modify that height"""
 
+    # Precomputed results of every operation on every tile type, see build_transitions()
+    # transitions[at_ground][op][tile_type] -> (new tile type, height change, actual change)
+    transitions = None
+    # (left, bottom, right, top) -> tile type
+    tile_type_index = dict((v, k) for k, v in enumerate(heightfield.TILE_TYPE_VERTICES))
+
     def __init__(self, height, vertices):
         self.array = vertices
         self.height = height
@@ -48,9 +70,24 @@ class TGrid(object):
     def set_height(self, h):
         self.height = h
 
+    def apply(self, op):
+        """Apply a terrain operation by looking it up in the transition tables
+        Returns the actual change made, or None if the tables can't be used for this tile"""
+        if TGrid.transitions is None:
+            return None
+        tile_type = TGrid.tile_type_index.get(tuple(self.array))
+        if tile_type is None:
+            return None
+        tile_type, height_change, change = TGrid.transitions[self.height == 0][op][tile_type]
+        self.height += height_change
+        self.array = list(heightfield.TILE_TYPE_VERTICES[tile_type])
+        return change
+
     # Terrain modification functions
     def raise_face(self):
         """Raise an entire face of a tile (all 4 vertices)"""
+        if self.apply(OP_RAISE_FACE) is not None:
+            return
         # Sort the correct tile type
         if 2 in self:
             self.height += 1
@@ -68,6 +105,8 @@ class TGrid(object):
         """Raise a tile edge, takes two vertices as arguments which define the edge"""
         v1 = v1 % 4
         v2 = v2 % 4
+        if v2 == (v1 + 1) % 4 and self.apply(OP_RAISE_EDGE + v1) is not None:
+            return True
         if self.array[v1] < self.array[v2]:
             self.raise_vertex(v1)
         elif self.array[v1] > self.array[v2]:
@@ -80,6 +119,8 @@ class TGrid(object):
     def raise_vertex(self, v):
         """Raise vertex, and if all vertices > 1 raise tile"""
         v = v % 4
+        if self.apply(OP_RAISE_VERTEX + v) is not None:
+            return True
         # First raise target vertex
         self.array[v] += 1
         # Then do a consistency check
@@ -89,6 +130,9 @@ class TGrid(object):
 
     def lower_face(self):
         """Lower an entire face of a tile (all 4 vertices)"""
+        change = self.apply(OP_LOWER_FACE)
+        if change is not None:
+            return change
         # Sort the correct tile type
         if 2 in self:
             for k in range(len(self)):
@@ -110,6 +154,10 @@ class TGrid(object):
         """Lower a tile edge, takes two vertices as arguments which define the edge"""
         v1 = v1 % 4
         v2 = v2 % 4
+        if v2 == (v1 + 1) % 4:
+            change = self.apply(OP_LOWER_EDGE + v1)
+            if change is not None:
+                return change
 
         if self.array[v1] > self.array[v2]:
             return self.lower_vertex(v1)
@@ -121,6 +169,9 @@ class TGrid(object):
     def lower_vertex(self, v):
         """Lower vertex, or if vertex is 0 lower entire tile then lower vertex"""
         v = v % 4
+        change = self.apply(OP_LOWER_VERTEX + v)
+        if change is not None:
+            return change
         if self.array[v] != 0:
             self.array[v] -= 1
         elif self.height != 0:
@@ -189,6 +240,78 @@ class TGrid(object):
             self.height += 1
 
 
+def run_op(tgrid, op):
+    """Run a terrain operation on a TGrid, return the actual change made"""
+    if op == OP_RAISE_FACE:
+        tgrid.raise_face()
+        return 1
+    elif op == OP_LOWER_FACE:
+        return tgrid.lower_face()
+    elif op < OP_LOWER_VERTEX:
+        tgrid.raise_vertex(op - OP_RAISE_VERTEX)
+        return 1
+    elif op < OP_RAISE_EDGE:
+        return tgrid.lower_vertex(op - OP_LOWER_VERTEX)
+    elif op < OP_LOWER_EDGE:
+        tgrid.raise_edge(op - OP_RAISE_EDGE, op - OP_RAISE_EDGE + 1)
+        return 1
+    else:
+        return tgrid.lower_edge(op - OP_LOWER_EDGE, op - OP_LOWER_EDGE + 1)
+
+
+def subtile_op(subtile, lower=False):
+    """Return the terrain operation for a subtile selection (see World.type), or None if there isn't one"""
+    if subtile == 9:
+        return OP_LOWER_FACE if lower else OP_RAISE_FACE
+    elif subtile in [5, 6, 7, 8]:
+        return (OP_LOWER_EDGE if lower else OP_RAISE_EDGE) + subtile - 5
+    elif subtile in [1, 2, 3, 4]:
+        return (OP_LOWER_VERTEX if lower else OP_RAISE_VERTEX) + subtile - 1
+    else:
+        return None
+
+
+def build_transitions():
+    """Run every operation on every tile type through the general TGrid code
+    Height only matters when lowering at ground level, so tables are built for a tile at 0 and one above it"""
+    transitions = []
+    for height in (1, 0):
+        table = []
+        for op in range(NUM_OPS):
+            row = []
+            for vertices in heightfield.TILE_TYPE_VERTICES:
+                tgrid = TGrid(height, list(vertices))
+                change = run_op(tgrid, op)
+                row.append((TGrid.tile_type_index[tuple(tgrid.array)], tgrid.height - height, change))
+            table.append(row)
+        transitions.append(table)
+    return transitions
+
+
+TGrid.transitions = build_transitions()
+
+# The same tables as numpy arrays indexed [at_ground, op, tile_type], for applying operations to many tiles at once
+TRANSITION_TILE_TYPE = numpy.array([[[t[0] for t in row] for row in table] for table in TGrid.transitions],
+                                   dtype=numpy.int8)
+TRANSITION_HEIGHT = numpy.array([[[t[1] for t in row] for row in table] for table in TGrid.transitions],
+                                dtype=numpy.int16)
+TRANSITION_CHANGE = numpy.array([[[t[2] for t in row] for row in table] for table in TGrid.transitions],
+                                dtype=numpy.int8)
+
+
+def apply_transitions(heights, packed, op):
+    """Apply a terrain operation to arrays of tile heights and packed vertices
+    op can be a single operation or an array of them, all tiles must be of a valid tile type
+    Returns new (heights, packed vertices, actual change) arrays"""
+    heights = numpy.asarray(heights, dtype=numpy.int16)
+    tile_types = heightfield.PACKED_TO_TILE_TYPE_ARRAY[packed]
+    at_ground = (heights == 0).astype(numpy.intp)
+    new_types = TRANSITION_TILE_TYPE[at_ground, op, tile_types]
+    return (heights + TRANSITION_HEIGHT[at_ground, op, tile_types],
+            heightfield.TILE_TYPE_TO_PACKED_ARRAY[new_types],
+            TRANSITION_CHANGE[at_ground, op, tile_types])
+
+
 class World(object):
     """Holds all world-related variables and methods"""
 
@@ -540,7 +663,18 @@ class World(object):
                     [0, 0, 5, 2, 2, 6, 0, 0],
                     [0, 0, 0, 2, 2, 0, 0, 0], ]
 
+    # Hitboxes indexed by tile type
+    hitbox = list(map(type.get, heightfield.TILE_TYPES))
+
+    # Heightfield storage, paths are kept apart in a dict keyed by (x, y)
+    store = None
+    paths = None
+    # List-style compatibility view of the store, World.array[x][y]
     array = None
+    # Undo/redo history of edits to the store
+    journal = None
+    # No tile is higher than this, worked out on first use and only ever raised by edits
+    height_bound = None
 
     def __init__(self):
         if World.dxoff is None:
@@ -549,20 +683,8 @@ class World(object):
             World.dyoff = 0
         if World.blah is None:
             World.blah = "meh"
-        if World.array is None:
-            World.array = self.make_array()
-
-        World.WorldX = len(self.array)
-        World.WorldY = len(self.array[0])
-
-        # Width and Height of the world, in pixels
-        World.WorldWidth = (World.WorldX + World.WorldY) * p2
-        World.WorldWidth2 = int(World.WorldWidth / 2)
-        World.WorldHeight = ((World.WorldX + World.WorldY) * p4) + p2
-        # Width and Height of the world, in pixels
-        World.WorldWidth = (World.WorldX + World.WorldY) * p2
-        World.WorldWidth2 = int(World.WorldWidth / 2)
-        World.WorldHeight = ((World.WorldX + World.WorldY) * p4) + p2
+        if World.store is None:
+            World.load_tile_map(self.make_array())
 
     # Tile structure [height, vertexheight[left, bottom, right, top], [path_start, path_end], highlightinfo]
 
@@ -571,29 +693,56 @@ class World(object):
         """Generate a World array"""
         return tile_map
 
+    @staticmethod
+    def load_tile_map(array):
+        """Replace the World contents with a list-style tile map"""
+        store, paths = heightfield.from_tile_map(array)
+        World.set_store(store, paths)
+
+    @staticmethod
+    def load_file(filename, mode="c"):
+        """Replace the World contents with a memory-mapped world file"""
+        store, paths = world_file.load(filename, mode)
+        World.set_store(store, paths)
+
+    @staticmethod
+    def save_file(filename):
+        """Save the World contents to a world file"""
+        world_file.save(filename, World.store, World.paths)
+
+    @staticmethod
+    def new_flat(size_x, size_y, chunk_size=heightfield.ChunkedStore.CHUNK_SIZE):
+        """Replace the World with flat ground, chunks of storage are only allocated once they're edited"""
+        World.set_store(heightfield.ChunkedStore(size_x, size_y, chunk_size))
+
+    @staticmethod
+    def set_store(store, paths=None):
+        """Replace the World heightfield storage"""
+        World.store = store
+        World.paths = paths if paths is not None else {}
+        World.array = heightfield.TileArrayView(World.store, World.paths)
+        World.journal = edit_journal.EditJournal(store.size_y)
+        World.height_bound = None
+
+        World.WorldX = store.size_x
+        World.WorldY = store.size_y
+
+        # Width and Height of the world, in pixels
+        World.WorldWidth = (World.WorldX + World.WorldY) * p2
+        World.WorldWidth2 = int(World.WorldWidth / 2)
+        World.WorldHeight = ((World.WorldX + World.WorldY) * p4) + p2
+
     @staticmethod
     def add_path(x, y, path):
         """Add a path to the World"""
         # This needs bounds checking/sanitisation etc. added
-        try:
-            World.array[x][y][2]
-        except IndexError:
-            World.array[x][y].append([path])
-            # debug("(NEW) Adding path: %s to location: (%s,%s)" % (path, x, y))
-        else:
-            World.array[x][y][2].append(path)
-            # debug("(EXISTING) Adding path: %s to location: (%s,%s)" % (path, x, y))
+        World.paths.setdefault((x, y), []).append(path)
         return True
 
     @staticmethod
     def get_paths(x, y):
         """Return paths at specified tile coordinate"""
-        try:
-            World.array[x][y][2]
-        except IndexError:
-            return []
-        else:
-            return World.array[x][y][2]
+        return World.paths.get((x, y), [])
 
     @staticmethod
     def get_4_neighbour_paths(x, y, override=None):
@@ -609,17 +758,7 @@ class World(object):
                 else:
                     paths.append(override[(xx, yy)][2])
             else:
-                try:
-                    World.array[xx][yy]
-                except IndexError:
-                    paths.append([])
-                else:
-                    try:
-                        World.array[xx][yy][2]
-                    except IndexError:
-                        paths.append([])
-                    else:
-                        paths.append(World.array[xx][yy][2])
+                paths.append(World.get_paths(xx, yy))
         return paths
 
     @staticmethod
@@ -666,13 +805,176 @@ class World(object):
         """Return the offset of the display"""
         return World.dxoff, World.dyoff
 
+    @staticmethod
+    def screen_to_world(x, y=None):
+        """Convert a position on the screen to a position within the whole world image"""
+        if y is None:
+            x, y = x
+        return x + World.dxoff, y + World.dyoff
+
+    @staticmethod
+    def world_to_screen(rect):
+        """Convert an (x, y, width, height) rect within the whole world image to one on the screen"""
+        x, y, w, h = rect
+        return x - World.dxoff, y - World.dyoff, w, h
+
+    @staticmethod
+    def get_image_rect():
+        """Return the (x, y, width, height) rect of the whole world image, tall enough for the highest tile"""
+        top = -World.get_height_bound() * ph
+        return 0, top, World.WorldWidth, World.WorldHeight - top
+
     @staticmethod
     def set_height(tgrid, x, y=None):
         """Sets the height of a tile"""
         if y is None:
             x, y = x
-        World.array[x][y][0] = tgrid.height
-        World.array[x][y][1] = tgrid.array
+        if World.journal.recording():
+            World.journal.record_tile(World.store, x, y)
+        World.store.set(x, y, tgrid.height, heightfield.pack_vertices(tgrid.array))
+        World.raise_height_bound(tgrid.height)
+
+    @staticmethod
+    def set_tiles(xs, ys, heights, packed):
+        """Set the heights and packed vertices of a list of tiles, given as numpy arrays"""
+        if World.journal.recording():
+            World.journal.record(World.store, xs, ys)
+        World.store.scatter(xs, ys, heights, packed)
+        if len(heights):
+            World.raise_height_bound(numpy.max(heights))
+
+    @staticmethod
+    def modify_tile(op, x, y=None):
+        """Apply a terrain operation (OP_RAISE_FACE etc.) to a tile through the transition tables
+        Returns the actual change made"""
+        if y is None:
+            x, y = x
+        height, packed = World.store.get(x, y)
+        tile_type = heightfield.PACKED_TO_TILE_TYPE[packed]
+        if tile_type < 0:
+            # Not a valid tile, let TGrid sort it out
+            tgrid = TGrid(height, heightfield.unpack_vertices(packed))
+            change = run_op(tgrid, op)
+            World.set_height(tgrid, x, y)
+            return change
+        tile_type, height_change, change = TGrid.transitions[height == 0][op][tile_type]
+        if World.journal.recording():
+            World.journal.record_tile(World.store, x, y)
+        World.store.set(x, y, height + height_change, heightfield.TILE_TYPE_TO_PACKED[tile_type])
+        World.raise_height_bound(height + height_change)
+        return change
+
+    @staticmethod
+    def raise_region(tiles, amount, subtile=9):
+        """Raise a region of tiles by amount levels, each level raises only the lowest tiles of the region
+        subtile picks the face, edge or vertex to raise (see World.type)"""
+        return World.modify_region(tiles, amount, subtile_op(subtile), lower=False)
+
+    @staticmethod
+    def lower_region(tiles, amount, subtile=9):
+        """Lower a region of tiles by amount levels, each level lowers only the highest tiles of the region
+        Returns the actual lowering done, 0 to -amount"""
+        return World.modify_region(tiles, amount, subtile_op(subtile, lower=True), lower=True)
+
+    @staticmethod
+    def modify_region(tiles, amount, op, lower):
+        """Apply a terrain operation to a region of tiles over a number of levels
+        Tiles are bucketed by their starting level: the base height when raising, the height of the highest
+        vertex when lowering. Each step brings the next bucket into the frontier and applies op to the frontier
+        only, so there's no rescanning of the whole region.
+        Returns the sum of the actual change of the last frontier tile at each lowering step, as the
+        Terrain tool has always done; tiles must be unique and on the World"""
+        if not tiles or amount <= 0:
+            return 0
+        xs = numpy.array([t[0] for t in tiles])
+        ys = numpy.array([t[1] for t in tiles])
+        heights, packed = World.store.gather(xs, ys)
+        heights = numpy.array(heights, dtype=numpy.int16)
+        packed = numpy.array(packed, dtype=numpy.uint8)
+        bulk = bool((heightfield.PACKED_TO_TILE_TYPE_ARRAY[packed] >= 0).all())
+
+        if lower:
+            # Sort highest first, negating keeps the sort stable and searchsorted ascending
+            keys = -(heights + heightfield.unpack_vertex_array(packed).max(axis=-1))
+        else:
+            keys = heights.astype(numpy.int32)
+        order = numpy.argsort(keys, kind="mergesort")
+        sorted_keys = keys[order]
+        level = sorted_keys[0]
+        count = 0
+        r = 0
+        for _ in range(amount):
+            # The lowest level is 0, nothing can be lowered beyond it
+            if lower and level == 0:
+                break
+            count = numpy.searchsorted(sorted_keys, level, side="right")
+            frontier = order[:count]
+            if op is not None:
+                if bulk:
+                    heights[frontier], packed[frontier], change = apply_transitions(
+                        heights[frontier], packed[frontier], op)
+                    rr = int(change[numpy.argmax(frontier)])
+                else:
+                    # Invalid tiles in the region, go through TGrid one tile at a time
+                    for i in numpy.sort(frontier):
+                        rr = World.modify_tile(op, int(xs[i]), int(ys[i]))
+                if lower:
+                    r += rr
+            level += 1
+
+        if bulk:
+            touched = order[:count]
+            World.set_tiles(xs[touched], ys[touched], heights[touched], packed[touched])
+        return r
+
+    @staticmethod
+    def begin_edit():
+        """Start an undoable edit, every tile written until the matching end_edit() is recorded
+        Edits can be nested, the outermost one makes a single step of undo"""
+        World.journal.begin()
+
+    @staticmethod
+    def end_edit():
+        """Finish an undoable edit"""
+        World.journal.commit(World.store)
+
+    @staticmethod
+    def undo():
+        """Undo the last edit, returns the list of tiles changed"""
+        return World.write_history(World.journal.undo())
+
+    @staticmethod
+    def redo():
+        """Redo the last undone edit, returns the list of tiles changed"""
+        return World.write_history(World.journal.redo())
+
+    @staticmethod
+    def write_history(tiles):
+        """Write the (xs, ys, heights, packed) of an undo or redo to the World, returns the list of tiles changed"""
+        if tiles is None:
+            return []
+        xs, ys, heights, packed = tiles
+        World.set_tiles(xs, ys, heights, packed)
+        return list(zip(xs.tolist(), ys.tolist()))
+
+    @staticmethod
+    def get_height_bound():
+        """Return a height no tile in the World is higher than"""
+        if World.height_bound is None:
+            World.height_bound = World.store.max_height()
+        return World.height_bound
+
+    @staticmethod
+    def raise_height_bound(height):
+        """Make sure the height bound covers a tile just set to height"""
+        if World.height_bound is not None and height > World.height_bound:
+            World.height_bound = int(height)
+        World.store.raise_height_bound(height)
+
+    @staticmethod
+    def in_bounds(x, y):
+        """Return True if the tile coordinate is within the World"""
+        return 0 <= x < World.WorldX and 0 <= y < World.WorldY
 
     @staticmethod
     def get_height(x, y=None):
@@ -680,10 +982,53 @@ class World(object):
         if y is None:
             x, y = x
         # Bounds checks
-        if x > len(World.array) - 1 or y > len(World.array[0]) - 1 or x < 0 or y < 0:
+        if not World.in_bounds(x, y):
             return None
         else:
-            return TGrid(World.array[x][y][0], World.array[x][y][1])
+            height, packed = World.store.get(x, y)
+            return TGrid(height, heightfield.unpack_vertices(packed))
+
+    @staticmethod
+    def get_tile(x, y=None):
+        """Get (height, (left, bottom, right, top)) of a tile without building a TGrid
+        Returns None if the tile is off the World"""
+        if y is None:
+            x, y = x
+        if not World.in_bounds(x, y):
+            return None
+        height, packed = World.store.get(x, y)
+        return height, heightfield.VERTEX_UNPACK[packed]
+
+    @staticmethod
+    def get_tile_type(x, y=None):
+        """Get the tile type of a tile, an index into heightfield.TILE_TYPES"""
+        if y is None:
+            x, y = x
+        return heightfield.PACKED_TO_TILE_TYPE[World.store.get(x, y)[1]]
+
+    @staticmethod
+    def get_region(x0, y0, x1, y1):
+        """Return (heights, vertices) numpy arrays for the tiles x0 <= x < x1, y0 <= y < y1
+        The region is clipped to the World, vertices has shape (w, h, 4)"""
+        x0 = max(x0, 0)
+        y0 = max(y0, 0)
+        x1 = max(min(x1, World.WorldX), x0)
+        y1 = max(min(y1, World.WorldY), y0)
+        heights, packed = World.store.read_region(x0, y0, x1, y1)
+        return heights, heightfield.unpack_vertex_array(packed)
+
+    @staticmethod
+    def set_region(x0, y0, heights, vertices, fixed=0):
+        """Write (heights, vertices) numpy arrays to the World with their top-left corner at x0, y0
+        vertices has shape (w, h, 4) and is corrected to follow the vertex rules before being stored"""
+        heights, vertices = heightfield.correct_vertices(heights, vertices, fixed)
+        if World.journal.recording():
+            xs, ys = numpy.indices(heights.shape)
+            World.journal.record(World.store, xs.ravel() + x0, ys.ravel() + y0)
+        World.store.write_region(x0, y0, heights.astype(numpy.int16),
+                                 heightfield.pack_vertex_array(vertices))
+        if heights.size:
+            World.raise_height_bound(heights.max())
 
     @staticmethod
     def get_neighbours(x, y=None):
@@ -693,5 +1038,6 @@ class World(object):
         out = []
         for a in range(x - 1, x + 1):
             for b in range(y - 1, y + 1):
-                out.append(TGrid(World.array[a][b][0], World.array[a][b][1]))
+                height, packed = World.store.get(a, b)
+                out.append(TGrid(height, heightfield.unpack_vertices(packed)))
         return out
@@ -0,0 +1,120 @@
+import os
+import struct
+import sys
+
+import numpy
+
+import heightfield
+
+# File layout (all values little-endian):
+#   Header, HEADER_SIZE bytes:
+#     magic "PYTW", format version, header size, size_x, size_y,
+#     offset of the height plane, offset of the vertex plane, offset and count of the path section,
+#     from version 2 the height of the highest tile
+#   Height plane, int16 [size_x, size_y]
+#   Vertex plane, packed uint8 [size_x, size_y] (see heightfield.pack_vertices)
+#   Path section, one record per tile which has paths:
+#     x (uint32), y (uint32), number of paths (uint16), then (start, end) int16 pairs
+MAGIC = b"PYTW"
+VERSION = 2
+HEADER_SIZE = 64
+HEADER_FORMAT = "<4sHHIIQQQI"
+# Fields added by later versions, following HEADER_FORMAT
+MAX_HEIGHT_FORMAT = "<h"
+PATH_RECORD_FORMAT = "<IIH"
+PATH_FORMAT = "<hh"
+
+# Maximum number of tiles written to the file in one go when saving
+BAND_TILES = 1 << 24
+
+
+def save(filename, store, paths):
+    """Save a heightfield store and its paths to a world file
+    The file is written alongside and then moved into place, so saving over a mapped file is safe"""
+    size_x = store.size_x
+    size_y = store.size_y
+    heights_offset = HEADER_SIZE
+    vertices_offset = heights_offset + size_x * size_y * 2
+    paths_offset = vertices_offset + size_x * size_y
+    path_tiles = sorted(k for k, v in paths.items() if v)
+
+    band = max(1, BAND_TILES // max(size_y, 1))
+    temp_filename = filename + ".tmp"
+    max_height = 0
+    with open(temp_filename, "wb") as f:
+        f.write(b"\0" * HEADER_SIZE)
+        # Planes are written in bands of rows so that chunked stores never need to be made dense
+        for plane, dtype in ((0, "<i2"), (1, "u1")):
+            for x0 in range(0, size_x, band):
+                region = store.read_region(x0, 0, min(x0 + band, size_x), size_y)
+                if plane == 0 and region[0].size:
+                    max_height = max(max_height, int(region[0].max()))
+                f.write(region[plane].astype(dtype).tobytes())
+        for x, y in path_tiles:
+            f.write(struct.pack(PATH_RECORD_FORMAT, x, y, len(paths[(x, y)])))
+            for start, end in paths[(x, y)]:
+                f.write(struct.pack(PATH_FORMAT, start, end))
+        # The header goes in last, once the highest tile is known
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, HEADER_SIZE, size_x, size_y,
+                             heights_offset, vertices_offset, paths_offset, len(path_tiles))
+        header += struct.pack(MAX_HEIGHT_FORMAT, max_height)
+        f.seek(0)
+        f.write(header.ljust(HEADER_SIZE, b"\0"))
+    os.replace(temp_filename, filename)
+
+
+def read_header(f):
+    """Read and check the header of a world file, return it as a dict"""
+    data = f.read(HEADER_SIZE)
+    if len(data) < HEADER_SIZE:
+        raise ValueError("Not a world file: header too short")
+    fields = struct.unpack_from(HEADER_FORMAT, data)
+    magic, version, header_size, size_x, size_y, heights_offset, vertices_offset, paths_offset, path_count = fields
+    if magic != MAGIC:
+        raise ValueError("Not a world file: bad magic %r" % magic)
+    if version > VERSION:
+        raise ValueError("Unsupported world file version %s" % version)
+    # Version 1 files don't say how high the highest tile is
+    max_height = None
+    if version >= 2:
+        max_height = struct.unpack_from(MAX_HEIGHT_FORMAT, data, struct.calcsize(HEADER_FORMAT))[0]
+    return {"version": version, "header_size": header_size, "size_x": size_x, "size_y": size_y,
+            "heights_offset": heights_offset, "vertices_offset": vertices_offset,
+            "paths_offset": paths_offset, "path_count": path_count, "max_height": max_height}
+
+
+def load(filename, mode="c"):
+    """Load a world file, return (store, paths)
+    The height and vertex planes are memory-mapped, so only the pages which are read get loaded.
+    mode is passed to numpy.memmap, the default "c" keeps edits in memory until the World is saved,
+    "r+" writes edits straight through to the file
+    The height of the highest tile comes from the header, so finding it doesn't read the whole height plane;
+    with "r+" the file may have been edited since it was saved, so it isn't trusted"""
+    with open(filename, "rb") as f:
+        header = read_header(f)
+        paths = {}
+        f.seek(header["paths_offset"])
+        record_size = struct.calcsize(PATH_RECORD_FORMAT)
+        path_size = struct.calcsize(PATH_FORMAT)
+        for _ in range(header["path_count"]):
+            x, y, count = struct.unpack(PATH_RECORD_FORMAT, f.read(record_size))
+            paths[(x, y)] = [list(struct.unpack(PATH_FORMAT, f.read(path_size))) for _ in range(count)]
+
+    shape = (header["size_x"], header["size_y"])
+    heights = numpy.memmap(filename, dtype="<i2", mode=mode, offset=header["heights_offset"], shape=shape)
+    vertices = numpy.memmap(filename, dtype="u1", mode=mode, offset=header["vertices_offset"], shape=shape)
+    height_bound = header["max_height"] if mode != "r+" else None
+    return heightfield.DenseStore(shape[0], shape[1], heights, vertices, height_bound), paths
+
+
+def convert_tile_map(tile_map, filename):
+    """Convert a list-style tile map (like demo_map.tile_map) to a world file"""
+    store, paths = heightfield.from_tile_map(tile_map)
+    save(filename, store, paths)
+
+
+if __name__ == "__main__":
+    # Convert the demo map: python world_file.py demo_map.ptw
+    from demo_map import tile_map
+
+    convert_tile_map(tile_map, sys.argv[1] if len(sys.argv) > 1 else "demo_map.ptw")